@@ -0,0 +1,149 @@
+"""Compare first-page language detection with the sampled detection stage.
+
+Usage:
+    python benchmarks/language_detection.py /path/to/corpus [--labels labels.csv] [--repeat 3]
+
+Every .pdf and .epub under the corpus directory is run through two detectors:
+
+  first-page  the old approach: langdetect.detect() on the first 500
+              characters of the first page (PDF) or first chapter (EPUB)
+  sampled     detect_language() from source/app.py over the pages or
+              chapters chosen by sample_positions()
+
+Both timings include reading the text out of the book. The expected language
+of a book comes from --labels, a CSV of `path,language` rows with paths
+relative to the corpus; EPUBs without a label fall back to their declared
+dc:language. Books with neither are timed but left out of the accuracy
+figures. The script also reports the one-off cost of loading langdetect's
+profiles, which a worker process pays once per import rather than per book,
+and checks that repeated runs give the same answers. Importing the app seeds
+langdetect; the first-page baseline runs unseeded, as it did before.
+"""
+import argparse
+import csv
+import os
+import statistics
+import sys
+import time
+import zipfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'source'))
+
+import app  # noqa: E402
+import PyPDF2  # noqa: E402
+from langdetect import DetectorFactory, detect  # noqa: E402
+from langdetect.detector_factory import init_factory  # noqa: E402
+
+
+def find_books(corpus_dir):
+    paths = []
+    for root, dirs, files in os.walk(corpus_dir):
+        paths.extend(os.path.join(root, f) for f in files if f.lower().endswith(('.pdf', '.epub')))
+    return sorted(paths)
+
+
+def load_labels(corpus_dir, labels_path):
+    if not labels_path:
+        return {}
+    with open(labels_path, newline='') as f:
+        return {os.path.normpath(os.path.join(corpus_dir, row[0])): row[1].strip().lower()
+                for row in csv.reader(f) if len(row) >= 2}
+
+
+def declared_language(path):
+    """dc:language of an EPUB, normalized like the importer does, or None"""
+    try:
+        with zipfile.ZipFile(path) as zip_ref:
+            opf_path, tree = app.read_epub_package(zip_ref)
+        return app.opf_tree_metadata(tree).get('language')
+    except Exception:
+        return None
+
+
+def first_page(path):
+    """The old detector: first 500 characters of page 0 / the first chapter"""
+    try:
+        if path.lower().endswith('.pdf'):
+            with open(path, 'rb') as f:
+                pages = PyPDF2.PdfReader(f).pages
+                text = pages[0].extract_text()[:500] if len(pages) else ''
+        else:
+            with zipfile.ZipFile(path) as zip_ref:
+                opf_path, tree = app.read_epub_package(zip_ref)
+                members = app.epub_spine_members(opf_path, tree)
+                document = app.read_epub_chapter(zip_ref, members[0]) if members else None
+                text = ' '.join(document.itertext())[:500] if document is not None else ''
+        if len(text) > 50:
+            lang = detect(text)
+            return lang if lang in app.SUPPORTED_LANGUAGES else None
+    except Exception:
+        pass
+    return None
+
+
+def sampled(path):
+    """The new detector, reading only the sampled pages or chapters"""
+    try:
+        if path.lower().endswith('.pdf'):
+            with open(path, 'rb') as f:
+                return app.detect_language(app.pdf_text_samples(PyPDF2.PdfReader(f)))
+        with zipfile.ZipFile(path) as zip_ref:
+            opf_path, tree = app.read_epub_package(zip_ref)
+            return app.detect_language(app.epub_text_samples(zip_ref, opf_path, tree))
+    except Exception:
+        return None
+
+
+def measure(detector, path, repeat):
+    """Best-of-`repeat` wall time and every run's answer"""
+    best, answers = None, []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        answers.append(detector(path))
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, answers
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('corpus', help='Directory containing .pdf and .epub files (searched recursively)')
+    parser.add_argument('--labels', help='CSV of path,language rows with the expected languages')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs per book; the best is kept')
+    args = parser.parse_args()
+
+    paths = find_books(args.corpus)
+    if not paths:
+        sys.exit(f'No .pdf or .epub files found under {args.corpus}')
+    labels = load_labels(args.corpus, args.labels)
+    expected = {path: labels.get(os.path.normpath(path)) or
+                (declared_language(path) if path.lower().endswith('.epub') else None)
+                for path in paths}
+
+    start = time.perf_counter()
+    init_factory()
+    print(f"langdetect profiles loaded in {(time.perf_counter() - start) * 1000:.0f}ms "
+          f"(once per worker process)\n")
+
+    # (detector, langdetect seed): the app's seed would make the old detector look stable
+    detectors = {'first-page': (first_page, None), 'sampled': (sampled, DetectorFactory.seed)}
+    labelled = [path for path in paths if expected[path]]
+    for name, (detector, seed) in detectors.items():
+        DetectorFactory.seed = seed
+        times, correct, unknown, unstable = [], 0, 0, 0
+        for path in paths:
+            elapsed, answers = measure(detector, path, args.repeat)
+            times.append(elapsed)
+            if len(set(answers)) > 1:
+                unstable += 1
+            if answers[0] is None:
+                unknown += 1
+            elif answers[0] == expected[path]:
+                correct += 1
+        print(f"{name:10} {len(paths) / max(sum(times), 1e-9):8.1f} books/s  "
+              f"median {statistics.median(times) * 1000:8.2f}ms/book  "
+              f"correct {correct}/{len(labelled)}  no answer {unknown}  unstable {unstable}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,346 @@
+"""Benchmark the main routes against synthetic libraries of growing size.
+
+Usage:
+    python benchmarks/routes.py [--books 1000 10000] [--subjects 300] [--downloads 50000]
+        [--zip-books 50] [--iterations 200] [--scenarios index,download,...]
+        [--save results.json] [--compare baseline.json] [--threshold 0.2]
+
+For every --books size, synthetic_library.py builds a library in a temporary
+directory. Each scenario then runs in a fresh process, against its own copy of
+the library, and drives the app through the Flask test client:
+
+  index            catalogue front page
+  index-filtered   catalogue filtered by a random language and subject
+  index-search     full-text search for a random word
+  api-books        JSON listing, as fetched by infinite scroll
+  subjects         get_all_subjects(), the subject filter's query
+  book-page        a random book's page
+  admin-panel      the admin panel's first page
+  admin-api        admin JSON listing, searched and sorted by title, plus one book's edit data
+  download         POST /download/<id>: logs the download and sends the file
+  export-emails    the streamed CSV export of the whole download log
+  import-zip       upload_calibre_zip() plus running the import job (--zip-books books)
+
+The catalogue page cache is off unless --page-cache is given, so the views
+themselves are measured. Each scenario reports latency percentiles,
+throughput and the process's peak RSS. Scenarios that fan out to worker
+processes (import-zip) also report the largest worker's peak RSS, which
+getrusage() does not include in the parent's; with --zip-books large enough
+to keep every worker busy, the import holds about parent + IMPORT_PROCESSES x
+worker. Running each scenario in its own process keeps one scenario's peak
+memory from hiding another's.
+
+--save writes the results and run parameters to JSON. --compare reads such a
+file and flags every scenario whose median latency or peak RSS grew, or whose
+throughput dropped, by more than --threshold. The exit status is 1 when
+something regressed, so the comparison can gate CI. Compare runs on the same
+machine with the same parameters; the seed makes the libraries identical.
+"""
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import synthetic_library
+
+SEARCH_WORDS = ('history', 'river', 'poetry', 'machine', 'kingdom', 'physics')
+
+
+def open_app(workdir, page_cache):
+    A = synthetic_library.load_app(workdir)
+    A.app.config['PAGE_CACHE_BACKEND'] = 'memory' if page_cache else None
+    return A
+
+
+def catalogue_sample(A):
+    """Ids, languages and subjects to pick request parameters from"""
+    with A.app.app_context():
+        max_id = A.db.session.query(A.db.func.max(A.Book.id)).scalar() or 1
+        languages = [lang for (lang,) in A.db.session.query(A.Book.language).distinct()]
+        subjects = [name for name, count in A.get_all_subjects()]
+    return max_id, languages, subjects
+
+
+# Scenarios: op(A, client, rng, sample) performs one operation and returns
+# (response or None, units of work done)
+def index(A, client, rng, sample):
+    return client.get('/'), 1
+
+
+def index_filtered(A, client, rng, sample):
+    max_id, languages, subjects = sample
+    return client.get('/', query_string={'language': rng.choice(languages),
+                                         'subject': rng.choice(subjects[:50])}), 1
+
+
+def index_search(A, client, rng, sample):
+    return client.get('/', query_string={'search': rng.choice(SEARCH_WORDS)}), 1
+
+
+def api_books(A, client, rng, sample):
+    max_id, languages, subjects = sample
+    return client.get('/api/books', query_string={'language': rng.choice(languages)}), 1
+
+
+def subjects(A, client, rng, sample):
+    with A.app.app_context():
+        A.get_all_subjects()
+        A.db.session.remove()
+    return None, 1
+
+
+def book_page(A, client, rng, sample):
+    return client.get(f'/book/{rng.randint(1, sample[0])}'), 1
+
+
+def admin_panel(A, client, rng, sample):
+    return client.get('/admin/panel'), 1
+
+
+def admin_api(A, client, rng, sample):
+    listing = client.get('/admin/api/books', query_string={'search': rng.choice(SEARCH_WORDS), 'sort': 'title'})
+    if listing.status_code >= 400:
+        return listing, 0
+    return client.get(f'/admin/api/books/{rng.randint(1, sample[0])}'), 1
+
+
+def download(A, client, rng, sample):
+    return client.post(f'/download/{rng.randint(1, sample[0])}',
+                       data={'email': f'bench{rng.randrange(1000)}@example.org'}), 1
+
+
+def export_emails(A, client, rng, sample):
+    return client.get('/admin/export-emails'), 1
+
+
+def import_zip(A, client, rng, sample):
+    with open('calibre-export.zip', 'rb') as f:
+        response = client.post('/admin/upload-calibre-zip', data={'zip_file': (f, 'calibre-export.zip')},
+                               content_type='multipart/form-data')
+    if response.status_code >= 400:
+        return response, 0
+    # Run the queued job here rather than in the background worker thread
+    with A.app.app_context():
+        job = A.claim_job(A.ImportJob)
+        A.run_import_job(job)
+        added = job.books_added
+        A.db.session.remove()
+    return None, added
+
+
+# name: (op, unit, share of --iterations to run)
+SCENARIOS = {
+    'index': (index, 'req', 1),
+    'index-filtered': (index_filtered, 'req', 1),
+    'index-search': (index_search, 'req', 1),
+    'api-books': (api_books, 'req', 1),
+    'subjects': (subjects, 'call', 1),
+    'book-page': (book_page, 'req', 1),
+    'admin-panel': (admin_panel, 'req', 0.25),
+    'admin-api': (admin_api, 'req', 0.25),
+    'download': (download, 'req', 1),
+    'export-emails': (export_emails, 'req', 0.05),
+    # Importing the same archive twice would only find duplicates
+    'import-zip': (import_zip, 'book', 0),
+}
+
+
+def percentile(ordered, q):
+    """Nearest-rank percentile of an ascending list"""
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q / 100 * len(ordered)) - 1))]
+
+
+def run_scenario(conn, workdir, name, iterations, warmup, seed, page_cache):
+    """Child process: run one scenario and send back its figures"""
+    A = open_app(workdir, page_cache)
+    op, unit, share = SCENARIOS[name]
+    client = A.app.test_client()
+    rng = random.Random(seed)
+    sample = catalogue_sample(A)
+    count = max(1, int(iterations * share))
+    warmup = warmup if share else 0
+
+    times, units, errors = [], 0, 0
+    for i in range(warmup + count):
+        start = time.perf_counter()
+        response, done = op(A, client, rng, sample)
+        if response is not None:
+            # Streamed responses do their work while the body is read
+            response.get_data()
+            if response.status_code >= 400:
+                errors += 1
+            response.close()
+        elapsed = time.perf_counter() - start
+        if i >= warmup:
+            times.append(elapsed)
+            units += done
+
+    times.sort()
+    conn.send({
+        'scenario': name,
+        'iterations': count,
+        'p50_ms': percentile(times, 50) * 1000,
+        'p90_ms': percentile(times, 90) * 1000,
+        'p99_ms': percentile(times, 99) * 1000,
+        'mean_ms': sum(times) / len(times) * 1000,
+        'throughput': units / max(sum(times), 1e-9),
+        'unit': unit,
+        # ru_maxrss is in KiB on Linux; for RUSAGE_CHILDREN it is the largest
+        # single worker that has been waited for, not their sum
+        'peak_rss_mib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'worker_rss_mib': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+        'errors': errors,
+    })
+    conn.close()
+
+
+def generate_library(conn, workdir, books, subjects, downloads, zip_books, seed):
+    """Child process: build the library, so the parent never imports the app"""
+    synthetic_library.generate(workdir, books, subjects, downloads, zip_books, seed)
+    conn.send(True)
+    conn.close()
+
+
+def in_child(target, *args):
+    """Run target(conn, *args) in a fresh interpreter and return what it sends"""
+    context = multiprocessing.get_context('spawn')
+    parent_conn, child_conn = context.Pipe(duplex=False)
+    process = context.Process(target=target, args=(child_conn,) + args)
+    process.start()
+    child_conn.close()
+    try:
+        result = parent_conn.recv()
+    except EOFError:
+        result = None
+    process.join()
+    if result is None:
+        sys.exit(f'{target.__name__}{args[1:]} failed (exit code {process.exitcode})')
+    return result
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results):
+    print(f"{'scenario':15} {'books':>7} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} "
+          f"{'throughput':>14} {'peak RSS':>10} {'worker RSS':>10} {'errors':>6}")
+    for r in results:
+        worker_rss = f"{r['worker_rss_mib']:7.1f}MiB" if r.get('worker_rss_mib') else f"{'-':>10}"
+        print(f"{r['scenario']:15} {r['books']:7} {r['p50_ms']:9.2f} {r['p90_ms']:9.2f} {r['p99_ms']:9.2f} "
+              f"{r['throughput']:9.1f} {r['unit'] + '/s':>4} {r['peak_rss_mib']:7.1f}MiB {worker_rss} {r['errors']:6}")
+
+
+def compare(results, baseline, threshold):
+    """Print changes against a saved run; returns the number of regressions"""
+    if baseline.get('params') != results['params']:
+        print('\nNote: the baseline was run with different parameters; changes may not be comparable')
+    before = {(r['scenario'], r['books']): r for r in baseline['results']}
+    print(f"\nCompared with {baseline.get('revision') or 'baseline'} from {baseline.get('created', '?')} "
+          f"(regression threshold {threshold:.0%}):")
+    regressions = 0
+    for r in results['results']:
+        old = before.get((r['scenario'], r['books']))
+        if old is None:
+            print(f"{r['scenario']:15} {r['books']:7}  new")
+            continue
+        changes = {
+            'p50': r['p50_ms'] / max(old['p50_ms'], 1e-9) - 1,
+            'throughput': r['throughput'] / max(old['throughput'], 1e-9) - 1,
+            'rss': r['peak_rss_mib'] / max(old['peak_rss_mib'], 1e-9) - 1,
+        }
+        if r.get('worker_rss_mib') and old.get('worker_rss_mib'):
+            changes['worker rss'] = r['worker_rss_mib'] / old['worker_rss_mib'] - 1
+        worse = [key for key, change in changes.items()
+                 if (change < -threshold if key == 'throughput' else change > threshold)]
+        regressions += bool(worse)
+        print(f"{r['scenario']:15} {r['books']:7}  "
+              + '  '.join(f'{key} {change:+7.1%}' for key, change in changes.items())
+              + ('  REGRESSED: ' + ', '.join(worse) if worse else ''))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--books', type=int, nargs='+', default=[1000, 10000], help='Library sizes to run')
+    parser.add_argument('--subjects', type=int, default=300)
+    parser.add_argument('--downloads', type=int, default=50000)
+    parser.add_argument('--zip-books', type=int, default=50, help='Books in the archive for import-zip')
+    parser.add_argument('--iterations', type=int, default=200, help='Timed operations per scenario')
+    parser.add_argument('--warmup', type=int, default=5, help='Untimed operations before timing starts')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='Comma-separated subset to run')
+    parser.add_argument('--page-cache', action='store_true', help='Leave the catalogue page cache on')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--save', help='Write the results to this JSON file')
+    parser.add_argument('--compare', help='JSON file from an earlier --save to compare with')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Relative change counted as a regression')
+    parser.add_argument('--keep', action='store_true', help="Keep the generated libraries' directory")
+    args = parser.parse_args()
+
+    names = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        sys.exit(f"Unknown scenarios: {', '.join(unknown)} (choose from {', '.join(SCENARIOS)})")
+
+    params = {key: getattr(args, key) for key in
+              ('books', 'subjects', 'downloads', 'zip_books', 'iterations', 'warmup', 'page_cache', 'seed')}
+    results = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'machine': f'{platform.system()} {platform.machine()}, {os.cpu_count()} CPUs',
+        'params': params,
+        'results': [],
+    }
+
+    root = tempfile.mkdtemp(prefix='library-bench-')
+    try:
+        for books in args.books:
+            base = os.path.join(root, f'library-{books}')
+            start = time.perf_counter()
+            in_child(generate_library, base, books, args.subjects, args.downloads,
+                     args.zip_books if 'import-zip' in names else 0, args.seed)
+            print(f'Generated {books} books in {time.perf_counter() - start:.1f}s',
+                  file=sys.stderr)
+            for name in names:
+                # Every scenario gets an untouched copy: downloads and imports write to it
+                workdir = os.path.join(root, f'run-{books}-{name}')
+                shutil.copytree(base, workdir)
+                result = in_child(run_scenario, workdir, name, args.iterations, args.warmup,
+                                  args.seed, args.page_cache)
+                result['books'] = books
+                results['results'].append(result)
+                shutil.rmtree(workdir)
+    finally:
+        if args.keep:
+            print(f'Libraries kept in {root}', file=sys.stderr)
+        else:
+            shutil.rmtree(root, ignore_errors=True)
+
+    print_results(results['results'])
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
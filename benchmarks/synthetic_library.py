@@ -0,0 +1,231 @@
+"""Generate a synthetic library for benchmarks and manual testing.
+
+Usage:
+    python benchmarks/synthetic_library.py OUTDIR [--books 5000] [--subjects 300]
+        [--downloads 50000] [--zip-books 100] [--seed 1]
+
+OUTDIR receives library.db, an uploads/ folder with the book files and, with
+--zip-books, calibre-export.zip laid out like a Calibre export
+(Author/Title (id)/ with the book, metadata.opf and cover.jpg). The same
+arguments and seed always produce the same library. To browse it:
+
+    cd OUTDIR && LIBRARY_DATABASE_URL=sqlite:///$PWD/library.db flask --app /path/to/source/app run
+
+Books are written straight into the tables in bulk, much faster than going
+through the upload route, with the same columns the app would fill in. The
+FTS triggers index them on insert. Subjects follow a long-tailed distribution,
+so a few subjects are very common, as in real catalogues. Downloads go into
+the Download table and the rollups are rebuilt from it.
+"""
+import argparse
+import io
+import os
+import random
+import sys
+import zipfile
+from datetime import datetime, timedelta
+
+SOURCE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'source')
+
+WORDS = (
+    'history art science river mountain city garden winter summer night light shadow empire '
+    'letters journey ocean island forest machine language memory silence fire stone glass '
+    'philosophy poetry music war peace theory practice nature society kingdom voyage dream '
+    'mathematics physics chemistry biology medicine law economics politics religion myth'
+).split()
+FIRST_NAMES = 'Anna Boris Clara David Elena Felix Greta Hugo Ines Jonas Karla Leon Mira Nils Olga Paul'.split()
+LAST_NAMES = 'Adler Berg Castell Dorn Eck Falk Graf Hahn Iser Jung Kraus Lang Moser Neumann Ott Pohl'.split()
+# Rough shares of a European academic catalogue
+LANGUAGES = (('en', 50), ('de', 20), ('fr', 12), ('es', 8), ('it', 6), ('ru', 4))
+
+
+def make_pdf(title, paragraphs):
+    """A small, valid PDF with one page of text per paragraph"""
+    objects = [b'<< /Type /Catalog /Pages 2 0 R >>', None,
+               b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>']
+    kids = []
+    for text in [title] + paragraphs:
+        text = text.replace('\\', '').replace('(', '').replace(')', '')
+        stream = f'BT /F1 11 Tf 40 760 Td ({text}) Tj ET'.encode('latin-1', 'replace')
+        objects.append(b'<< /Length %d >>\nstream\n%s\nendstream' % (len(stream), stream))
+        objects.append(b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] '
+                       b'/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>' % len(objects))
+        kids.append(b'%d 0 R' % len(objects))
+    objects[1] = b'<< /Type /Pages /Kids [%s] /Count %d >>' % (b' '.join(kids), len(kids))
+
+    out = io.BytesIO()
+    out.write(b'%PDF-1.4\n')
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(out.tell())
+        out.write(b'%d 0 obj\n%s\nendobj\n' % (number, body))
+    xref = out.tell()
+    out.write(b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1))
+    for offset in offsets:
+        out.write(b'%010d 00000 n \n' % offset)
+    out.write(b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref))
+    return out.getvalue()
+
+
+def make_cover(rng, width=600, height=900):
+    from PIL import Image
+    out = io.BytesIO()
+    Image.new('RGB', (width, height), tuple(rng.randrange(256) for _ in range(3))).save(out, 'JPEG', quality=80)
+    return out.getvalue()
+
+
+def make_opf(book):
+    subjects = ''.join(f'<dc:subject>{s}</dc:subject>' for s in book['subjects'])
+    return (
+        '<?xml version="1.0" encoding="utf-8"?>'
+        '<package xmlns="http://www.idpf.org/2007/opf" version="2.0">'
+        '<metadata xmlns:dc="http://purl.org/dc/elements/1.1/">'
+        f'<dc:title>{book["title"]}</dc:title><dc:creator>{book["author"]}</dc:creator>'
+        f'<dc:language>{book["language"]}</dc:language><dc:description>{book["description"]}</dc:description>'
+        f'{subjects}</metadata></package>'
+    ).encode('utf-8')
+
+
+class LibraryGenerator:
+    """Deterministic synthetic books, subjects and downloads for one seed"""
+
+    def __init__(self, seed=1, subjects=300):
+        self.rng = random.Random(seed)
+        self.subject_names = [f'{self.rng.choice(WORDS).title()} {self.rng.choice(WORDS).title()} {i}'
+                              for i in range(subjects)]
+        # Zipf-like weights: subject i is about 1/(i+1) as common as the first
+        self.subject_weights = [1 / (i + 1) for i in range(subjects)]
+        self.languages, self.language_weights = zip(*LANGUAGES)
+
+    def book(self, number):
+        rng = self.rng
+        title = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(2, 6))).title()
+        subjects = list(dict.fromkeys(rng.choices(self.subject_names, self.subject_weights, k=rng.randint(1, 4))))
+        return {
+            'title': f'{title} {number}',
+            'author': f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+            'language': rng.choices(self.languages, self.language_weights)[0],
+            'description': ' '.join(rng.choice(WORDS) for _ in range(rng.randint(20, 80))).capitalize() + '.',
+            'subjects': subjects,
+        }
+
+    def pdf(self, book, pages=3):
+        paragraphs = [' '.join(self.rng.choice(WORDS) for _ in range(60)) for _ in range(pages)]
+        return make_pdf(book['title'], paragraphs)
+
+
+def populate(app_module, generator, books, downloads, files=20, now=None):
+    """Fill an empty database and storage with `books` books and `downloads` downloads
+
+    Only `files` distinct book files are stored; books share them the way
+    linked duplicates do, which keeps generation fast for large catalogues.
+    """
+    A = app_module
+    db = A.db
+    now = now or datetime(2024, 1, 1)
+    rng = generator.rng
+
+    stored = []
+    for i in range(files):
+        data = generator.pdf(generator.book(f'file {i}'))
+        key, content_hash = A.get_storage().put_stream('books', io.BytesIO(data), '.pdf')
+        stored.append((key, content_hash))
+
+    subject_ids = {}
+    for name in generator.subject_names:
+        subject_ids[name] = db.session.execute(db.insert(A.Subject).values(name=name)).inserted_primary_key[0]
+
+    chunk = 1000
+    for start in range(0, books, chunk):
+        rows, links = [], []
+        for number in range(start, min(start + chunk, books)):
+            book = generator.book(number)
+            key, content_hash = stored[number % files]
+            rows.append({
+                'id': number + 1,
+                'title': book['title'], 'author': book['author'], 'description': book['description'],
+                'language': book['language'], 'filename': key, 'file_type': 'pdf',
+                'subjects': ', '.join(book['subjects']),
+                'upload_date': now - timedelta(minutes=rng.randrange(2 * 365 * 24 * 60)),
+                'content_hash': content_hash,
+            })
+            links.extend({'book_id': number + 1, 'subject_id': subject_ids[name]} for name in book['subjects'])
+        db.session.execute(db.insert(A.Book), rows)
+        db.session.execute(db.insert(A.book_subject), links)
+    db.session.commit()
+
+    emails = [f'reader{i}@example.org' for i in range(max(1, downloads // 5))]
+    for start in range(0, downloads, chunk * 10):
+        db.session.execute(db.insert(A.Download), [
+            {'book_id': rng.randint(1, books), 'email': rng.choice(emails),
+             'download_date': now - timedelta(seconds=rng.randrange(365 * 24 * 3600))}
+            for _ in range(start, min(start + chunk * 10, downloads))])
+    db.session.commit()
+    A.rebuild_download_stats()
+    A.bump_catalogue_version()
+    db.session.commit()
+
+
+def write_calibre_zip(path, generator, books, first_id=1):
+    """A Calibre-style export with distinct PDFs, OPF metadata and covers"""
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for number in range(first_id, first_id + books):
+            book = generator.book(f'import {number}')
+            folder = f"{book['author']}/{book['title']} ({number})/"
+            zf.writestr(folder + f"{book['title']} - {book['author']}.pdf", generator.pdf(book))
+            zf.writestr(folder + 'metadata.opf', make_opf(book))
+            zf.writestr(folder + 'cover.jpg', make_cover(generator.rng))
+
+
+def load_app(workdir):
+    """Import source/app.py against a library in `workdir`
+
+    Must run before anything else imports the app: the database URL is read
+    at import, and uploads and caches are relative to the working directory.
+    """
+    os.makedirs(workdir, exist_ok=True)
+    os.environ['LIBRARY_DATABASE_URL'] = 'sqlite:///' + os.path.join(os.path.abspath(workdir), 'library.db')
+    os.chdir(workdir)
+    sys.path.insert(0, os.path.abspath(SOURCE_DIR))
+    import app
+    # send_from_directory() resolves relative folders against the app's root, not the working directory
+    app.app.config['UPLOAD_FOLDER'] = os.path.abspath(app.app.config['UPLOAD_FOLDER'])
+    for kind in app.UPLOAD_SUBDIRS:
+        os.makedirs(os.path.join(app.app.config['UPLOAD_FOLDER'], kind), exist_ok=True)
+    return app
+
+
+def generate(workdir, books, subjects, downloads, zip_books=0, seed=1):
+    """Create a library in `workdir`; returns the app module bound to it"""
+    A = load_app(workdir)
+    generator = LibraryGenerator(seed, subjects)
+    with A.app.app_context():
+        A.init_db()
+        populate(A, generator, books, downloads)
+        # Leave a single self-contained file that can be copied for each run
+        A.db.session.execute(A.db.text('PRAGMA wal_checkpoint(TRUNCATE)'))
+        A.db.session.remove()
+        A.db.engine.dispose()
+    if zip_books:
+        write_calibre_zip(os.path.join(workdir, 'calibre-export.zip'), generator, zip_books)
+    return A
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('outdir', help='Empty or new directory for the library')
+    parser.add_argument('--books', type=int, default=5000)
+    parser.add_argument('--subjects', type=int, default=300, help='Distinct subjects (long-tailed use)')
+    parser.add_argument('--downloads', type=int, default=50000, help='Rows in the download log')
+    parser.add_argument('--zip-books', type=int, default=0, help='Books in calibre-export.zip (0 = none)')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    if os.path.exists(os.path.join(args.outdir, 'library.db')):
+        sys.exit(f'{args.outdir} already holds a library')
+    generate(args.outdir, args.books, args.subjects, args.downloads, args.zip_books, args.seed)
+    print(f'{args.books} books, {args.subjects} subjects, {args.downloads} downloads in {args.outdir}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,44 +1,437 @@
 # Ask Ollama client
-from flask import Flask, render_template, request, redirect, url_for, send_file, send_from_directory, flash, jsonify, Response
+from flask import Flask, Request, render_template, request, redirect, url_for, send_from_directory, flash, jsonify, Response, abort, stream_with_context, session, g, has_request_context
+from flask.signals import before_render_template, template_rendered
 from flask_sqlalchemy import SQLAlchemy
+from markupsafe import Markup, escape
+from sqlalchemy.engine import Engine
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+import sqlite3
 from werkzeug.utils import secure_filename
+from werkzeug.security import safe_join
 import os
-from datetime import datetime
+from datetime import date, datetime, timedelta
 import PyPDF2
 import ebooklib
 from ebooklib import epub
-from langdetect import detect
+from langdetect import DetectorFactory, LangDetectException, detect_langs
+from langdetect.detector_factory import init_factory
 from lxml import etree
 import zipfile
 import shutil
+import posixpath
 import re
 from html import unescape
 import csv
-from io import StringIO
+from collections import OrderedDict
+from functools import wraps
+import zlib
+import base64
+import hashlib
+import json
+import time
+import uuid
+import threading
+import queue
+import itertools
+import multiprocessing
+import logging
+import atexit
+import fcntl
+from concurrent.futures import ProcessPoolExecutor
+from io import StringIO, BytesIO
+from PIL import Image, features
+import click
+from urllib.parse import quote, unquote
+import mimetypes
+import tempfile
+from contextlib import ExitStack, closing, contextmanager
+try:
+    import boto3  # Only needed for STORAGE_BACKEND = 's3'
+    from botocore.exceptions import BotoCoreError, ClientError
+except ImportError:
+    boto3 = None
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your-super-secret-key-change-this-1234567890'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///library.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('LIBRARY_DATABASE_URL', 'sqlite:///library.db')  # Relative to instance/
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLITE_BUSY_TIMEOUT'] = 30  # Seconds a connection waits for another worker's write lock
 app.config['UPLOAD_FOLDER'] = 'uploads'
+app.config['METADATA_CACHE_FOLDER'] = os.path.join('uploads', 'cache', 'metadata')  # Parsed metadata by content hash
 app.config['MAX_CONTENT_LENGTH'] = 500 * 1024 * 1024  # 500MB max file size for zip files
+app.config['UPLOAD_CHUNK_BYTES'] = 8 * 1024 * 1024  # Request size of resumable ZIP uploads; below nginx's client_max_body_size
+app.config['UPLOAD_EXPIRE_SECONDS'] = 86400  # Unfinished resumable uploads idle this long are discarded
+app.config['COVER_WIDTHS'] = (160, 320, 640)  # Cover derivative widths in pixels
+app.config['COVER_FORMAT'] = 'webp'  # 'webp' or 'jpeg'; falls back to JPEG without WebP support
+app.config['COVER_CACHE_MAX_AGE'] = 86400  # Seconds browsers may cache covers without a content hash
+# nginx internal location for X-Accel-Redirect offload (conf/nginx.conf); unset = Flask sends files
+app.config['X_ACCEL_REDIRECT_PREFIX'] = os.environ.get('LIBRARY_X_ACCEL_PREFIX')
+# Where books and covers live: 'local' (UPLOAD_FOLDER) or 's3' (any S3-compatible service, e.g. MinIO).
+# S3 credentials come from the usual AWS_ACCESS_KEY_ID / AWS_SECRET_ACCESS_KEY environment variables.
+app.config['STORAGE_BACKEND'] = os.environ.get('LIBRARY_STORAGE', 'local')
+app.config['S3_BUCKET'] = os.environ.get('LIBRARY_S3_BUCKET')
+app.config['S3_PREFIX'] = os.environ.get('LIBRARY_S3_PREFIX', '')  # Key prefix inside the bucket
+app.config['S3_ENDPOINT_URL'] = os.environ.get('LIBRARY_S3_ENDPOINT_URL')  # e.g. http://127.0.0.1:9000; unset = AWS
+app.config['S3_REGION'] = os.environ.get('LIBRARY_S3_REGION')
+app.config['S3_URL_EXPIRES'] = 300  # Seconds a presigned download URL stays valid
+app.config['HOT_COVER_CACHE_BYTES'] = 32 * 1024 * 1024  # Covers from remote storage kept in memory, per worker
+app.config['PAGE_CACHE_BACKEND'] = 'memory'  # Catalogue page cache: 'memory', 'disk' or None
+app.config['PAGE_CACHE_SIZE'] = 256  # Pages kept by the memory backend, per worker
+app.config['PAGE_CACHE_FOLDER'] = os.path.join('uploads', 'cache', 'pages')  # Disk backend, shared by workers
+app.config['PAGE_CACHE_GRACE_SECONDS'] = 300  # Disk backend: older versions' pages are removed once unused this long
+app.config['BOOKS_PER_PAGE'] = 48  # Catalogue page size
+app.config['ADMIN_BOOKS_PER_PAGE'] = 100  # Admin panel page size
+app.config['MAX_BOOKS_PER_PAGE'] = 200  # Upper bound for ?per_page=
+app.config['IMPORT_PROCESSES'] = min(4, os.cpu_count() or 1)  # Parallel book parsers per job
+app.config['IMPORT_BATCH_SIZE'] = 25  # Books committed (and resumable) per batch
+app.config['IMPORT_STALE_SECONDS'] = 120  # A running job without heartbeat this long is resumed
+app.config['DUPLICATE_UPLOADS'] = 'skip'  # Uploads identical to a stored book: 'skip', or 'link' a new record to its file
+app.config['LANGUAGE_SAMPLES'] = 5  # Pages or chapters sampled to detect a book's language
+app.config['LANGUAGE_SAMPLE_CHARS'] = 1000  # Characters of each sample given to the detector
+app.config['CONTENT_CHUNK_CHARS'] = 2000  # Size of the text pieces indexed for in-book search
+app.config['CONTENT_INDEX_CHUNK_SIZE'] = 20  # Books per index-contents chunk; each may take seconds to extract
+app.config['CONTENT_SEARCH_LIMIT'] = 200  # Matching text pieces considered per in-book search
+app.config['MAINTENANCE_CHUNK_SIZE'] = 500  # Books per committed (and resumable) maintenance chunk
+app.config['LOG_FORMAT'] = os.environ.get('LIBRARY_LOG_FORMAT', 'json')  # 'json' lines for journald, or 'text'
+app.config['METRICS_ENABLED'] = True  # Per-request timings and query counts, served at /metrics
+app.config['METRICS_FOLDER'] = os.path.join('uploads', 'cache', 'metrics')  # Per-worker snapshots summed by /metrics
+app.config['METRICS_FLUSH_SECONDS'] = 5  # How often a worker writes its metrics snapshot
+app.config['SLOW_REQUEST_SECONDS'] = 1.0  # Requests slower than this are logged with their timing split
+# How downloads are logged: 'sync' (committed before the file is sent), 'memory' (queued and committed in
+# batches by a thread; a crashed worker loses its queue) or 'journal' (queued, and appended to a local file first)
+app.config['DOWNLOAD_LOG'] = os.environ.get('LIBRARY_DOWNLOAD_LOG', 'sync')
+app.config['DOWNLOAD_LOG_QUEUE_SIZE'] = 10000  # Downloads waiting for the writer before requests have to wait
+app.config['DOWNLOAD_LOG_WAIT_SECONDS'] = 2  # How long a request waits for room before writing its download itself
+app.config['DOWNLOAD_LOG_BATCH_SIZE'] = 500  # Downloads committed per transaction
+app.config['DOWNLOAD_LOG_FLUSH_SECONDS'] = 1.0  # Longest a queued download waits to be written
+app.config['DOWNLOAD_JOURNAL_FOLDER'] = os.path.join('uploads', 'journal')  # 'journal' mode: one file per worker
 
 db = SQLAlchemy(app)
 
+@db.event.listens_for(Engine, 'connect')
+def configure_sqlite_connection(dbapi_connection, connection_record):
+    """Let several gunicorn workers share library.db
+
+    WAL lets readers proceed while one connection writes, and the busy
+    timeout makes a writer wait for the lock instead of failing at once.
+    """
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA busy_timeout = {int(app.config['SQLITE_BUSY_TIMEOUT'] * 1000)}")
+    cursor.execute("PRAGMA journal_mode = WAL")
+    # Safe with WAL: a power loss can drop the last commits but never corrupts the file
+    cursor.execute("PRAGMA synchronous = NORMAL")
+    cursor.close()
+
+# Logging
+# One JSON object per line on stderr, collected by journald; the fields
+# passed with extra= become keys, so log lines can be filtered by book or job.
+LOG_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+class LogFormatter(logging.Formatter):
+    """JSON lines, or `level message key=value ...` when LOG_FORMAT is 'text'"""
+
+    def __init__(self, as_json):
+        super().__init__()
+        self.as_json = as_json
+
+    def format(self, record):
+        fields = {key: value for key, value in vars(record).items() if key not in LOG_RECORD_ATTRIBUTES}
+        if record.exc_info:
+            fields['exception'] = self.formatException(record.exc_info)
+        if not self.as_json:
+            return ' '.join([record.levelname, record.getMessage()] + [f'{k}={v}' for k, v in fields.items()])
+        entry = {
+            'time': datetime.utcfromtimestamp(record.created).isoformat(timespec='milliseconds') + 'Z',
+            'level': record.levelname.lower(),
+            'pid': record.process,
+            'message': record.getMessage(),
+        }
+        entry.update(fields)
+        return json.dumps(entry, default=str)
+
+log = logging.getLogger('library')
+if not log.handlers:
+    log_handler = logging.StreamHandler()
+    log_handler.setFormatter(LogFormatter(app.config['LOG_FORMAT'] == 'json'))
+    log.addHandler(log_handler)
+    log.setLevel(logging.INFO)
+    log.propagate = False
+
+def timings_ms(timings):
+    """Stage timings in seconds as rounded milliseconds, for log fields"""
+    return {stage: round(seconds * 1000, 1) for stage, seconds in timings.items()}
+
+# Metrics
+# Counters and histograms in the Prometheus text format. Each process keeps
+# its own samples and writes them to METRICS_FOLDER every
+# METRICS_FLUSH_SECONDS; /metrics adds up the snapshots of all gunicorn
+# workers. Snapshots of exited workers are folded into retired.json, so
+# counters don't drop when gunicorn recycles a worker.
+METRICS = {
+    # name: (type, help, histogram buckets)
+    'library_http_requests_total': ('counter', 'HTTP requests by endpoint, method and status', None),
+    'library_http_request_seconds': ('histogram', 'Request duration by endpoint',
+                                     (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)),
+    'library_http_phase_seconds_total': ('counter', 'Request time spent in SQL, template rendering and storage I/O', None),
+    'library_sql_queries_total': ('counter', 'SQL statements run by requests, by endpoint', None),
+    'library_sql_queries_per_request': ('histogram', 'SQL statements per request; high counts point at N+1 queries',
+                                        (1, 2, 5, 10, 20, 50, 100, 250)),
+    'library_page_cache_total': ('counter', 'Catalogue page cache lookups by result', None),
+    'library_books_parsed_total': ('counter', 'Books parsed at upload or import, by file type and metadata cache use', None),
+    'library_book_stage_seconds_total': ('counter', 'Time spent per ingest stage of uploaded and imported books', None),
+    'library_download_log_total': ('counter', 'Downloads logged, by how they reached the database', None),
+}
+
+def metric_sample(name, labels=None):
+    """Sample name with labels, e.g. library_sql_queries_total{endpoint="index"}"""
+    if not labels:
+        return name
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for value in labels.values())
+    return name + '{' + ','.join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + '}'
+
+def merge_samples(totals, samples):
+    for name, values in samples.items():
+        family = totals.setdefault(name, {})
+        for sample, value in values.items():
+            family[sample] = family.get(sample, 0) + value
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+class MetricsRegistry:
+    """This process's samples, as {metric name: {sample: value}}"""
+
+    def __init__(self):
+        self.samples = {}
+        self.lock = threading.Lock()
+        self.flushed_at = time.monotonic()
+
+    def inc(self, name, labels=None, value=1):
+        if not app.config['METRICS_ENABLED']:
+            return
+        sample = metric_sample(name, labels)
+        with self.lock:
+            family = self.samples.setdefault(name, {})
+            family[sample] = family.get(sample, 0) + value
+
+    def observe(self, name, value, labels=None):
+        """Add a value to a histogram; buckets are cumulative, as Prometheus expects"""
+        if not app.config['METRICS_ENABLED']:
+            return
+        labels = labels or {}
+        with self.lock:
+            family = self.samples.setdefault(name, {})
+            for bound in METRICS[name][2] + ('+Inf',):
+                sample = metric_sample(f'{name}_bucket', {**labels, 'le': bound})
+                family[sample] = family.get(sample, 0) + (1 if bound == '+Inf' or value <= bound else 0)
+            for suffix, amount in (('_sum', value), ('_count', 1)):
+                sample = metric_sample(name + suffix, labels)
+                family[sample] = family.get(sample, 0) + amount
+
+    def flush(self, force=False):
+        """Write this process's snapshot, at most every METRICS_FLUSH_SECONDS unless forced"""
+        now = time.monotonic()
+        if not self.samples or (not force and now - self.flushed_at < app.config['METRICS_FLUSH_SECONDS']):
+            return
+        self.flushed_at = now
+        with self.lock:
+            data = json.dumps(self.samples)
+        folder = app.config['METRICS_FOLDER']
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, f'{os.getpid()}.json')
+        temp_path = f'{path}.{threading.get_ident()}.part'
+        with open(temp_path, 'w') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+    def collect(self):
+        """Samples of every worker, this one included, added up"""
+        self.flush(force=True)
+        folder = app.config['METRICS_FOLDER']
+        if not os.path.isdir(folder):
+            return {}
+        retire_exited_snapshots(folder)
+        totals = {}
+        for name in sorted(os.listdir(folder)):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(folder, name)) as f:
+                    merge_samples(totals, json.load(f))
+            except (OSError, ValueError):
+                # Retired by another worker in the meantime
+                continue
+        return totals
+
+def retire_exited_snapshots(folder):
+    """Fold the snapshots of exited workers into retired.json"""
+    exited = [name for name in os.listdir(folder)
+              if name.endswith('.json') and name[:-5].isdigit() and not process_alive(int(name[:-5]))]
+    if not exited:
+        return
+    retired_path = os.path.join(folder, 'retired.json')
+    with open(os.path.join(folder, 'retired.lock'), 'w') as lock:
+        # Only one worker at a time may move a snapshot, or it would be counted twice
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            with open(retired_path) as f:
+                retired = json.load(f)
+        except (OSError, ValueError):
+            retired = {}
+        for name in exited:
+            path = os.path.join(folder, name)
+            try:
+                with open(path) as f:
+                    merge_samples(retired, json.load(f))
+            except (OSError, ValueError):
+                continue
+            with open(retired_path + '.part', 'w') as f:
+                json.dump(retired, f)
+            os.replace(retired_path + '.part', retired_path)
+            os.remove(path)
+
+def render_metrics(samples):
+    """Prometheus text exposition format"""
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        lines.extend(f'{sample} {value}' for sample, value in samples.get(name, {}).items())
+    return '\n'.join(lines) + '\n'
+
+metrics = MetricsRegistry()
+atexit.register(metrics.flush, True)
+
+class RequestTimer:
+    """Where the current request's time goes, kept in g.request_timer"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.sql_seconds = 0.0
+        self.sql_queries = 0
+        self.render_seconds = 0.0
+        self.render_started = None
+        self.io_seconds = 0.0
+        self.io_depth = 0
+
+def current_timer():
+    return g.get('request_timer') if has_request_context() else None
+
+@contextmanager
+def timed_io():
+    """Count the enclosed storage I/O towards the current request's I/O time"""
+    timer = current_timer()
+    if timer is None or timer.io_depth:
+        # Outside a request, or already inside a timed call
+        yield
+        return
+    timer.io_depth += 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer.io_depth -= 1
+        timer.io_seconds += time.perf_counter() - start
+
+# Same recipe as the SQLAlchemy profiling docs; the start times are a stack
+# because a connection may run a statement from inside another one's events
+@db.event.listens_for(Engine, 'before_cursor_execute')
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+@db.event.listens_for(Engine, 'after_cursor_execute')
+def record_query_time(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_started'].pop()
+    timer = current_timer()
+    if timer is not None:
+        timer.sql_seconds += elapsed
+        timer.sql_queries += 1
+
+@before_render_template.connect_via(app)
+def start_render_timer(sender, template, context, **extra):
+    timer = current_timer()
+    if timer is not None:
+        timer.render_started = (time.perf_counter(), timer.sql_seconds)
+
+@template_rendered.connect_via(app)
+def record_render_time(sender, template, context, **extra):
+    timer = current_timer()
+    if timer is not None and timer.render_started:
+        started, sql_before = timer.render_started
+        # Lazy loads run while rendering; count them as SQL only
+        timer.render_seconds += time.perf_counter() - started - (timer.sql_seconds - sql_before)
+        timer.render_started = None
+
+@app.before_request
+def start_request_timer():
+    if app.config['METRICS_ENABLED']:
+        g.request_timer = RequestTimer()
+
+@app.after_request
+def record_request_metrics(response):
+    """Record the request's timing split and query count, and expose them as Server-Timing"""
+    timer = g.pop('request_timer', None)
+    if timer is None:
+        return response
+    elapsed = time.perf_counter() - timer.started
+    endpoint = request.endpoint or 'none'
+    phases = {'sql': timer.sql_seconds, 'render': timer.render_seconds, 'io': timer.io_seconds}
+
+    metrics.inc('library_http_requests_total',
+                {'endpoint': endpoint, 'method': request.method, 'status': response.status_code})
+    metrics.observe('library_http_request_seconds', elapsed, {'endpoint': endpoint})
+    for phase, seconds in phases.items():
+        metrics.inc('library_http_phase_seconds_total', {'endpoint': endpoint, 'phase': phase}, seconds)
+    metrics.inc('library_sql_queries_total', {'endpoint': endpoint}, timer.sql_queries)
+    metrics.observe('library_sql_queries_per_request', timer.sql_queries, {'endpoint': endpoint})
+
+    response.headers['Server-Timing'] = ', '.join(
+        [f'{phase};dur={seconds * 1000:.1f}' for phase, seconds in phases.items()] +
+        [f'total;dur={elapsed * 1000:.1f}'])
+    if elapsed >= app.config['SLOW_REQUEST_SECONDS']:
+        log.warning('Slow request', extra={
+            'endpoint': endpoint, 'path': request.path, 'status': response.status_code,
+            'queries': timer.sql_queries, 'timings_ms': timings_ms({**phases, 'total': elapsed})})
+    metrics.flush()
+    return response
+
+def record_ingest_metrics(file_type, timings, cached):
+    """Count a parsed book and its per-stage timings"""
+    metrics.inc('library_books_parsed_total', {'file_type': file_type, 'cached': 'yes' if cached else 'no'})
+    for stage, seconds in timings.items():
+        metrics.inc('library_book_stage_seconds_total', {'stage': stage}, seconds)
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """All workers' metrics for Prometheus; conf/nginx.conf keeps this off the public site"""
+    if not app.config['METRICS_ENABLED']:
+        abort(404)
+    return Response(render_metrics(metrics.collect()), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 # Custom filter to strip HTML tags
+# Compiled once; [^>]* needs no backtracking and also matches tags split over lines
+HTML_TAG_RE = re.compile(r'<[^>]*>')
+
 @app.template_filter('strip_html')
 def strip_html_tags(text):
     """Remove HTML tags from a string"""
     if not text:
         return ''
-    # Unescape HTML entities first
-    text = unescape(text)
-    # Remove HTML tags
-    clean = re.compile('<.*?>')
-    text = re.sub(clean, '', text)
+    # Plain text only needs its whitespace normalized
+    if '<' in text or '&' in text:
+        # Unescape HTML entities first, so escaped markup is removed too
+        text = HTML_TAG_RE.sub('', unescape(text))
     # Remove extra whitespace
-    text = ' '.join(text.split())
-    return text
+    return ' '.join(text.split())
 
 # Supported languages
 SUPPORTED_LANGUAGES = [
@@ -47,20 +440,43 @@ SUPPORTED_LANGUAGES = [
     'sv', 'tr', 'uk', 'zh-cn'
 ]
 
+def split_subjects(text):
+    """Split a comma-separated subjects string into unique, trimmed names"""
+    if not text:
+        return []
+    # dict.fromkeys preserves order while removing duplicates
+    return list(dict.fromkeys(s.strip() for s in text.split(',') if s.strip()))
+
 # NEW: Helper function to get all unique subjects
 def get_all_subjects():
-    """Extract all unique subjects from all books"""
-    books = Book.query.all()
-    subjects = set()
-    
-    for book in books:
-        if book.subjects:
-            # Split comma-separated subjects and clean them
-            book_subjects = [s.strip() for s in book.subjects.split(',') if s.strip()]
-            subjects.update(book_subjects)
-    
-    # Return sorted list for nice alphabetical display
-    return sorted(subjects)
+    """Return (subject, book count) pairs for every subject in use, sorted by name"""
+    book_count = db.func.count(book_subject.c.book_id)
+    return db.session.query(Subject.name, book_count) \
+        .join(book_subject, Subject.id == book_subject.c.subject_id) \
+        .group_by(Subject.id) \
+        .order_by(Subject.name) \
+        .all()
+
+def get_or_create_subjects(names):
+    """Load Subject rows for the given names, creating any that are missing"""
+    if not names:
+        return []
+    existing = {s.name: s for s in Subject.query.filter(Subject.name.in_(names))}
+    subjects = []
+    for name in names:
+        subject = existing.get(name)
+        if subject is None:
+            subject = Subject(name=name)
+            db.session.add(subject)
+            existing[name] = subject
+        subjects.append(subject)
+    return subjects
+
+def set_book_subjects(book, subjects):
+    """Set a book's subjects string and keep the normalized subject index in step"""
+    names = split_subjects(subjects)
+    book.subjects = ', '.join(names)
+    book.subject_tags = get_or_create_subjects(names)
 
 class Book(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -69,16 +485,68 @@ class Book(db.Model):
     description = db.Column(db.Text)
     language = db.Column(db.String(10))
     filename = db.Column(db.String(500), nullable=False)
-    cover_image = db.Column(db.String(500))
+    cover_image = db.Column(db.String(500))  # Largest cover derivative (or a legacy original)
+    cover_widths = db.Column(db.String(50))  # Comma-separated derivative widths, e.g. "160,320,640"
     upload_date = db.Column(db.DateTime, default=datetime.utcnow)
     file_type = db.Column(db.String(10))
     subjects = db.Column(db.Text)  # Comma-separated tags/subjects
+    description_hash = db.Column(db.String(16))  # Hash of the description last verified clean
+    content_hash = db.Column(db.String(64), index=True)  # SHA-256 of the book file; duplicates share it
+    content_indexed_hash = db.Column(db.String(64))  # content_hash whose text is in book_content
+
+    __table_args__ = (
+        # Back the keyset-paginated listings, with and without a language filter
+        db.Index('ix_book_upload_date_id', 'upload_date', 'id'),
+        db.Index('ix_book_language_upload_date_id', 'language', 'upload_date', 'id'),
+    )
+
+    # Normalized copy of `subjects`, kept in sync by set_book_subjects()
+    subject_tags = db.relationship('Subject', secondary='book_subject', lazy='selectin',
+                                   backref=db.backref('books', lazy='dynamic'))
+
+class Subject(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(200), unique=True, nullable=False)
+
+book_subject = db.Table(
+    'book_subject',
+    db.Column('book_id', db.Integer, db.ForeignKey('book.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('subject_id', db.Integer, db.ForeignKey('subject.id', ondelete='CASCADE'), primary_key=True),
+    # The primary key covers book -> subjects; this covers subject -> books
+    db.Index('ix_book_subject_subject_id', 'subject_id', 'book_id'),
+)
 
 class Download(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    book_id = db.Column(db.Integer, db.ForeignKey('book.id'), nullable=False)
+    book_id = db.Column(db.Integer, db.ForeignKey('book.id'), nullable=False, index=True)
     email = db.Column(db.String(200), nullable=False)
-    download_date = db.Column(db.DateTime, default=datetime.utcnow)
+    download_date = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+# Download rollups, maintained by record_downloads() in the same transaction
+# as the Download rows, so admin statistics never scan the Download table
+class DailyDownloads(db.Model):
+    book_id = db.Column(db.Integer, db.ForeignKey('book.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    downloads = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        # Per-day trends and "top books since" both filter on day first
+        db.Index('ix_daily_downloads_day_book', 'day', 'book_id'),
+    )
+
+class DownloadEmail(db.Model):
+    email = db.Column(db.String(200), primary_key=True)  # Lower-cased and trimmed
+    first_download = db.Column(db.DateTime, nullable=False, index=True)
+    last_download = db.Column(db.DateTime, nullable=False)
+    downloads = db.Column(db.Integer, nullable=False, default=0)
+
+class BookContent(db.Model):
+    """One piece of a book's text: part of a PDF page or of an EPUB chapter"""
+    id = db.Column(db.Integer, primary_key=True)
+    book_id = db.Column(db.Integer, db.ForeignKey('book.id'), nullable=False, index=True)
+    position = db.Column(db.Integer, nullable=False)  # Reading order within the book
+    location = db.Column(db.String(200))  # Shown with search hits, e.g. "p. 12" or a chapter title
+    text = db.Column(db.Text, nullable=False)
 
 class SiteSettings(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -100,10 +568,835 @@ class DonationLink(db.Model):
     description = db.Column(db.String(200))
     order = db.Column(db.Integer, default=0)
 
+class ImportJob(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    filename = db.Column(db.String(500), nullable=False)  # Original upload name
+    archive_path = db.Column(db.String(500), nullable=False)
+    status = db.Column(db.String(20), default='queued', nullable=False, index=True)  # uploading, queued, running, done, failed
+    total = db.Column(db.Integer, default=0)  # Book folders found in the archive
+    processed = db.Column(db.Integer, default=0)  # Folders handled so far (resume point)
+    books_added = db.Column(db.Integer, default=0)
+    books_failed = db.Column(db.Integer, default=0)
+    books_duplicate = db.Column(db.Integer, default=0)  # Skipped as identical to a stored book
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)  # Refreshed while running; stale means abandoned
+    upload_size = db.Column(db.BigInteger)  # Bytes expected by a resumable upload
+    upload_key = db.Column(db.String(300), index=True)  # Browser's name for the file, to resume its upload
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'filename': self.filename,
+            'status': self.status,
+            'upload_size': self.upload_size,
+            'total': self.total,
+            'processed': self.processed,
+            'books_added': self.books_added,
+            'books_failed': self.books_failed,
+            'books_duplicate': self.books_duplicate or 0,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+class MaintenanceJob(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    task = db.Column(db.String(50), nullable=False)  # Key of MAINTENANCE_TASKS
+    status = db.Column(db.String(20), default='queued', nullable=False, index=True)  # queued, running, done, failed
+    last_id = db.Column(db.Integer, default=0)  # Highest book id handled (resume point)
+    total = db.Column(db.Integer, default=0)  # Books to visit when the job started
+    processed = db.Column(db.Integer, default=0)
+    changed = db.Column(db.Integer, default=0)
+    skipped = db.Column(db.Integer, default=0)  # Rows already clean, left untouched
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'task': self.task,
+            'status': self.status,
+            'total': self.total,
+            'processed': self.processed,
+            'changed': self.changed,
+            'skipped': self.skipped,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+# Full-text search index (SQLite FTS5)
+# book_fts is an external-content table over `book`; triggers keep it in sync
+# on every insert, edit, delete and ZIP import, so routes never touch it directly.
+FTS_COLUMNS = ['title', 'author', 'description', 'subjects']
+# bm25() column weights, in FTS_COLUMNS order: a title hit outranks a description hit
+FTS_WEIGHTS = (10.0, 5.0, 1.0, 3.0)
+
+def init_search_index():
+    """Create the FTS5 table and sync triggers, rebuilding it if it is new"""
+    if db.engine.dialect.name != 'sqlite':
+        app.config['FTS_ENABLED'] = False
+        return
+
+    columns = ', '.join(FTS_COLUMNS)
+    new_values = ', '.join(f'new.{c}' for c in FTS_COLUMNS)
+    old_values = ', '.join(f'old.{c}' for c in FTS_COLUMNS)
+
+    try:
+        with db.engine.begin() as conn:
+            exists = conn.execute(db.text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'book_fts'"
+            )).first() is not None
+
+            conn.execute(db.text(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS book_fts USING fts5("
+                f"{columns}, content='book', content_rowid='id', "
+                f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+            ))
+            conn.execute(db.text(
+                f"CREATE TRIGGER IF NOT EXISTS book_fts_ai AFTER INSERT ON book BEGIN "
+                f"INSERT INTO book_fts(rowid, {columns}) VALUES (new.id, {new_values}); END"
+            ))
+            conn.execute(db.text(
+                f"CREATE TRIGGER IF NOT EXISTS book_fts_ad AFTER DELETE ON book BEGIN "
+                f"INSERT INTO book_fts(book_fts, rowid, {columns}) VALUES ('delete', old.id, {old_values}); END"
+            ))
+            conn.execute(db.text(
+                f"CREATE TRIGGER IF NOT EXISTS book_fts_au AFTER UPDATE OF {columns} ON book BEGIN "
+                f"INSERT INTO book_fts(book_fts, rowid, {columns}) VALUES ('delete', old.id, {old_values}); "
+                f"INSERT INTO book_fts(rowid, {columns}) VALUES (new.id, {new_values}); END"
+            ))
+
+            # Existing databases already have books: index them once
+            if not exists:
+                conn.execute(db.text("INSERT INTO book_fts(book_fts) VALUES ('rebuild')"))
+        app.config['FTS_ENABLED'] = True
+    except Exception as e:
+        # SQLite built without FTS5: search falls back to ilike filters
+        log.warning('Full-text search unavailable', extra={'error': str(e)})
+        app.config['FTS_ENABLED'] = False
+
+def init_content_index():
+    """Create the FTS5 index over book_content and the triggers that keep it in sync
+
+    book_content rows are replaced by the index-contents maintenance task; the
+    triggers mirror them into book_content_fts and drop a book's text when the
+    book is deleted or its file changes.
+    """
+    if not app.config.get('FTS_ENABLED'):
+        return
+    statements = [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS book_content_fts USING fts5("
+        "text, content='book_content', content_rowid='id', "
+        "tokenize='unicode61 remove_diacritics 2')",
+        "CREATE TRIGGER IF NOT EXISTS book_content_ai AFTER INSERT ON book_content BEGIN "
+        "INSERT INTO book_content_fts(rowid, text) VALUES (new.id, new.text); END",
+        "CREATE TRIGGER IF NOT EXISTS book_content_ad AFTER DELETE ON book_content BEGIN "
+        "INSERT INTO book_content_fts(book_content_fts, rowid, text) VALUES ('delete', old.id, old.text); END",
+        "CREATE TRIGGER IF NOT EXISTS book_content_book_ad AFTER DELETE ON book BEGIN "
+        "DELETE FROM book_content WHERE book_id = old.id; END",
+        "CREATE TRIGGER IF NOT EXISTS book_content_book_au AFTER UPDATE OF content_hash ON book "
+        "WHEN old.content_hash IS NOT new.content_hash BEGIN "
+        "DELETE FROM book_content WHERE book_id = old.id; END",
+    ]
+    with db.engine.begin() as conn:
+        for statement in statements:
+            conn.execute(db.text(statement))
+
+def rebuild_search_index():
+    """Re-index every book from the `book` table"""
+    with db.engine.begin() as conn:
+        conn.execute(db.text("INSERT INTO book_fts(book_fts) VALUES ('rebuild')"))
+        conn.execute(db.text("INSERT INTO book_fts(book_fts) VALUES ('optimize')"))
+
+def build_fts_query(search_query):
+    """Turn a search box string into an FTS5 MATCH expression
+
+    "double quoted" text is matched as an exact phrase, every other word is
+    matched as a prefix (so "philo" finds "philosophy"). All terms must match.
+    Returns None when nothing searchable is left.
+    """
+    terms = []
+    for phrase, word in re.findall(r'"([^"]*)"|(\S+)', search_query):
+        if phrase:
+            tokens = re.findall(r'\w+', phrase)
+            if tokens:
+                terms.append('"' + ' '.join(tokens) + '"')
+        else:
+            # Strip FTS5 syntax characters; keep only word characters
+            for token in re.findall(r'\w+', word):
+                terms.append(f'"{token}"*')
+    return ' '.join(terms) or None
+
+def search_books(query, search_query):
+    """Restrict a Book query to FTS matches, ordered by BM25 relevance"""
+    fts_query = build_fts_query(search_query)
+    if fts_query is None:
+        return query.filter(db.false())
+
+    weights = ', '.join(str(w) for w in FTS_WEIGHTS)
+    matches = db.text(
+        f"SELECT rowid AS book_id, bm25(book_fts, {weights}) AS rank "
+        f"FROM book_fts WHERE book_fts MATCH :fts_query"
+    ).bindparams(fts_query=fts_query).columns(
+        db.column('book_id', db.Integer), db.column('rank', db.Float)
+    ).subquery()
+
+    return query.join(matches, Book.id == matches.c.book_id).order_by(matches.c.rank)
+
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+    """Rebuild the full-text search index for all books."""
+    init_db()
+    if not app.config.get('FTS_ENABLED'):
+        print('Full-text search is not available on this database')
+        return
+    rebuild_search_index()
+    print(f'Indexed {Book.query.count()} books')
+
+# Subject index migration
+def rebuild_subject_index():
+    """Rebuild the book/subject join table from every book's subjects string"""
+    db.session.execute(book_subject.delete())
+    count = 0
+    for book in Book.query.order_by(Book.id).yield_per(500):
+        set_book_subjects(book, book.subjects)
+        count += 1
+    db.session.commit()
+    return count
+
+@app.cli.command('rebuild-subject-index')
+def rebuild_subject_index_command():
+    """Rebuild the normalized subject index for all books."""
+    init_db()
+    print(f'Indexed subjects for {rebuild_subject_index()} books')
+
+# Download analytics
+def record_downloads(events):
+    """Add Download rows for (book_id, email, datetime) events and bump their rollups; the caller commits
+
+    The rollups get one upsert per book and day and one per email, however
+    many downloads the batch holds.
+    """
+    db.session.execute(db.insert(Download), [
+        {'book_id': book_id, 'email': email, 'download_date': when} for book_id, email, when in events])
+    
+    daily, per_email = {}, {}
+    for book_id, email, when in events:
+        daily[book_id, when.date()] = daily.get((book_id, when.date()), 0) + 1
+        first, last, count = per_email.get(email.strip().lower(), (when, when, 0))
+        per_email[email.strip().lower()] = (min(first, when), max(last, when), count + 1)
+    
+    insert = sqlite_insert(DailyDownloads).values(
+        [{'book_id': book_id, 'day': day, 'downloads': count} for (book_id, day), count in daily.items()])
+    db.session.execute(insert.on_conflict_do_update(
+        index_elements=['book_id', 'day'],
+        set_={'downloads': DailyDownloads.downloads + insert.excluded.downloads}))
+    
+    insert = sqlite_insert(DownloadEmail).values(
+        [{'email': email, 'first_download': first, 'last_download': last, 'downloads': count}
+         for email, (first, last, count) in per_email.items()])
+    db.session.execute(insert.on_conflict_do_update(
+        index_elements=['email'],
+        set_={'first_download': db.func.min(DownloadEmail.first_download, insert.excluded.first_download),
+              'last_download': db.func.max(DownloadEmail.last_download, insert.excluded.last_download),
+              'downloads': DownloadEmail.downloads + insert.excluded.downloads}))
+
+def rebuild_download_stats():
+    """Recompute the download rollups from the Download table"""
+    db.session.execute(db.delete(DailyDownloads))
+    db.session.execute(db.delete(DownloadEmail))
+    db.session.execute(db.text(
+        "INSERT INTO daily_downloads (book_id, day, downloads) "
+        "SELECT book_id, date(download_date), count(*) FROM download GROUP BY book_id, date(download_date)"
+    ))
+    db.session.execute(db.text(
+        "INSERT INTO download_email (email, first_download, last_download, downloads) "
+        "SELECT lower(trim(email)), min(download_date), max(download_date), count(*) "
+        "FROM download GROUP BY lower(trim(email))"
+    ))
+    db.session.commit()
+    return db.session.query(db.func.count(Download.id)).scalar()
+
+@app.cli.command('rebuild-download-stats')
+def rebuild_download_stats_command():
+    """Recompute download rollups from the raw download log."""
+    init_db()
+    print(f'Rolled up {rebuild_download_stats()} downloads')
+
+def get_download_stats(days=30):
+    """Totals, top books and a daily trend for the admin panel, from the rollups only"""
+    since = datetime.utcnow().date() - timedelta(days=days - 1)
+    
+    total_downloads = db.session.query(db.func.sum(DailyDownloads.downloads)).scalar() or 0
+    recent_total = db.func.sum(DailyDownloads.downloads)
+    top_books = db.session.query(Book.id, Book.title, recent_total.label('downloads')) \
+        .join(DailyDownloads, DailyDownloads.book_id == Book.id) \
+        .filter(DailyDownloads.day >= since) \
+        .group_by(Book.id) \
+        .order_by(recent_total.desc()) \
+        .limit(10).all()
+    
+    per_day = dict(db.session.query(DailyDownloads.day, db.func.sum(DailyDownloads.downloads))
+                   .filter(DailyDownloads.day >= since)
+                   .group_by(DailyDownloads.day).all())
+    # SQLite hands back dates as strings when grouping; normalize the keys
+    per_day = {d if isinstance(d, date) else date.fromisoformat(d): n for d, n in per_day.items()}
+    trend = [(since + timedelta(days=i), per_day.get(since + timedelta(days=i), 0)) for i in range(days)]
+    
+    return {
+        'days': days,
+        'total_downloads': total_downloads,
+        'unique_emails': db.session.query(db.func.count(DownloadEmail.email)).scalar(),
+        'new_emails': db.session.query(db.func.count(DownloadEmail.email))
+            .filter(DownloadEmail.first_download >= since).scalar(),
+        'top_books': top_books,
+        'trend': trend,
+        'trend_max': max((n for d, n in trend), default=0),
+    }
+
+# Write-behind download log
+# With DOWNLOAD_LOG 'memory' or 'journal', download_book() only queues the
+# download and a thread commits the queue in batches, so a burst of downloads
+# costs one write transaction per batch instead of one per request. A full
+# queue makes requests wait up to DOWNLOAD_LOG_WAIT_SECONDS for room and then
+# write their own download, so nothing is dropped. The queue is written out
+# when the process exits.
+#
+# In 'journal' mode every download is first appended to this process's file
+# in DOWNLOAD_JOURNAL_FOLDER, and each committed batch appends the sequence
+# numbers it wrote. Journals left by workers that died are replayed, minus
+# the committed numbers, by the next worker to start. Appends are flushed to
+# the OS but not fsynced: a killed worker loses nothing, a power cut may
+# lose the last moments.
+class DownloadLog:
+    """Downloads waiting for this process's writer thread, and its journal"""
+
+    def __init__(self):
+        self.queue = None
+        self.thread = None
+        self.lock = threading.Lock()
+        self.sequence = itertools.count(1)
+        self.journal = None
+        self.unwritten = 0  # Journalled downloads not yet committed
+
+    def record(self, book_id, email):
+        """Log a download, in the request or through the writer thread depending on DOWNLOAD_LOG"""
+        event = (book_id, email, datetime.utcnow())
+        if app.config['DOWNLOAD_LOG'] == 'sync':
+            record_downloads([event])
+            db.session.commit()
+            metrics.inc('library_download_log_total', {'result': 'sync'})
+            return
+        self.start()
+        with self.lock:
+            seq = next(self.sequence)
+            if self.journal:
+                self.journal.write(json.dumps([seq, book_id, email, event[2].isoformat()]) + '\n')
+                self.journal.flush()
+                self.unwritten += 1
+        try:
+            self.queue.put((seq, event), timeout=app.config['DOWNLOAD_LOG_WAIT_SECONDS'])
+            metrics.inc('library_download_log_total', {'result': 'queued'})
+        except queue.Full:
+            # Back-pressure: the writer is behind (or the database is locked)
+            record_downloads([event])
+            db.session.commit()
+            self.mark_written([seq])
+            metrics.inc('library_download_log_total', {'result': 'overflow'})
+
+    def start(self):
+        """Start this process's writer thread, replaying the journals of dead workers first"""
+        with self.lock:
+            if self.thread is not None and self.thread.is_alive():
+                return
+            self.queue = self.queue or queue.Queue(maxsize=app.config['DOWNLOAD_LOG_QUEUE_SIZE'])
+            if app.config['DOWNLOAD_LOG'] == 'journal' and self.journal is None:
+                folder = app.config['DOWNLOAD_JOURNAL_FOLDER']
+                os.makedirs(folder, exist_ok=True)
+                self.replay_journals(folder)
+                self.journal = open(os.path.join(folder, f'{os.getpid()}.jsonl'), 'a')
+            self.thread = threading.Thread(target=self.run, name='download-log', daemon=True)
+            self.thread.start()
+
+    def run(self):
+        with app.app_context():
+            while True:
+                batch = [self.queue.get()]
+                if batch[0] is None:
+                    return
+                deadline = time.monotonic() + app.config['DOWNLOAD_LOG_FLUSH_SECONDS']
+                while len(batch) < app.config['DOWNLOAD_LOG_BATCH_SIZE']:
+                    try:
+                        item = self.queue.get(timeout=max(0, deadline - time.monotonic()))
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        self.write(batch)
+                        return
+                    batch.append(item)
+                self.write(batch)
+
+    def write(self, batch):
+        """Commit a batch of (seq, event) pairs and note them in the journal"""
+        events = [event for seq, event in batch]
+        written = self.commit(events)
+        self.mark_written([seq for seq, event in batch])
+        metrics.inc('library_download_log_total', {'result': 'written'}, written)
+        if written < len(events):
+            metrics.inc('library_download_log_total', {'result': 'dropped'}, len(events) - written)
+
+    def commit(self, events):
+        """Commit download events, retrying while the database is unavailable; returns how many were kept"""
+        while True:
+            try:
+                # Downloads of books deleted in the meantime are dropped with them
+                live = {book_id for (book_id,) in db.session.query(Book.id)
+                        .filter(Book.id.in_({book_id for book_id, email, when in events}))}
+                written = [event for event in events if event[0] in live]
+                if written:
+                    record_downloads(written)
+                db.session.commit()
+                return len(written)
+            except Exception:
+                log.exception('Cannot write downloads; retrying', extra={'downloads': len(events)})
+                db.session.rollback()
+                time.sleep(1)
+            finally:
+                db.session.remove()
+
+    def mark_written(self, seqs):
+        with self.lock:
+            if not self.journal:
+                return
+            self.unwritten -= len(seqs)
+            if self.unwritten:
+                self.journal.write(json.dumps({'written': seqs}) + '\n')
+            else:
+                # Everything in the journal is in the database
+                self.journal.truncate(0)
+            self.journal.flush()
+
+    def replay_journals(self, folder):
+        """Commit the uncommitted downloads of exited workers' journals, then remove them"""
+        with open(os.path.join(folder, 'replay.lock'), 'w') as lock:
+            # One worker at a time, or a journal would be replayed twice
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            for name in sorted(os.listdir(folder)):
+                pid = name[:-6]
+                if not (name.endswith('.jsonl') and pid.isdigit()) or \
+                        (int(pid) != os.getpid() and process_alive(int(pid))):
+                    continue
+                path = os.path.join(folder, name)
+                events, written = {}, set()
+                with open(path) as f:
+                    for line in f:
+                        try:
+                            entry = json.loads(line)
+                        except ValueError:
+                            continue  # Cut short when the worker died
+                        if isinstance(entry, dict):
+                            written.update(entry['written'])
+                        else:
+                            seq, book_id, email, when = entry
+                            events[seq] = (book_id, email, datetime.fromisoformat(when))
+                pending = [event for seq, event in events.items() if seq not in written]
+                if pending:
+                    with app.app_context():
+                        self.commit(pending)
+                    log.info('Replayed download journal', extra={'journal': name, 'downloads': len(pending)})
+                os.remove(path)
+
+    def stop(self):
+        """Write out the queue and stop the writer; called at exit"""
+        if self.thread is not None and self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join(timeout=30)
+        with self.lock:
+            if self.journal:
+                self.journal.close()
+                if not self.unwritten:
+                    os.remove(self.journal.name)
+                self.journal = None
+
+download_log = DownloadLog()
+atexit.register(download_log.stop)
+
+def upgrade_schema():
+    """Add columns introduced after a table was first created"""
+    inspector = db.inspect(db.engine)
+    with db.engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    column_type = column.type.compile(dialect=db.engine.dialect)
+                    conn.execute(db.text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+                    log.info('Added column', extra={'table': table.name, 'column': column.name})
+
+def init_db():
+    """Create tables and the search indexes"""
+    db.create_all()
+    upgrade_schema()
+    # create_all() skips indexes on tables that already exist
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
+    init_search_index()
+    init_content_index()
+    init_catalogue_version()
+
+    # Hash books stored before content hashes existed, once, in the background
+    if MaintenanceJob.query.filter_by(task='hash-books').first() is None and \
+            Book.query.filter(Book.content_hash.is_(None)).first() is not None:
+        queue_maintenance_job('hash-books')
+    # ...and index their text for in-book search, after they are hashed
+    if app.config.get('FTS_ENABLED') and \
+            MaintenanceJob.query.filter_by(task='index-contents').first() is None and \
+            Book.query.filter(Book.content_indexed_hash.is_(None)).first() is not None:
+        queue_maintenance_job('index-contents')
+
+    # Databases from before the download rollups only have the raw log
+    if DailyDownloads.query.first() is None and Download.query.first() is not None:
+        log.info('Rolled up downloads', extra={'downloads': rebuild_download_stats()})
+
+    # Databases from before the subject index have subjects only as strings
+    if db.session.query(book_subject).first() is None and \
+            Book.query.filter(Book.subjects != '').first() is not None:
+        log.info('Migrated subjects', extra={'books': rebuild_subject_index()})
+
+# Blob storage
+# Books and covers are stored by content: a blob's key is its SHA-256 below two
+# levels of shard directories (ab/cd/abcd...), so no directory grows huge, names
+# never collide and identical content is stored once. Book.filename and
+# Book.cover_image hold these keys; flat names from before stay readable until
+# 'flask migrate-storage' moves them.
+UPLOAD_SUBDIRS = {'books', 'covers'}
+SHARDED_KEY_RE = re.compile(r'^[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}')
+
+def content_key(content_hash, suffix=''):
+    """Sharded storage key for a SHA-256 hex digest"""
+    return f"{content_hash[:2]}/{content_hash[2:4]}/{content_hash}{suffix}"
+
+class LocalStorage:
+    """Blobs in UPLOAD_FOLDER/<kind>/<key>, written to a temp file and renamed into place"""
+
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, kind, key):
+        return os.path.join(self.root, kind, *key.split('/'))
+
+    def temp_path(self, kind):
+        # Same file system as the blobs, so the final rename is atomic
+        temp_dir = os.path.join(self.root, kind, '.tmp')
+        os.makedirs(temp_dir, exist_ok=True)
+        return os.path.join(temp_dir, uuid.uuid4().hex)
+
+    def publish(self, temp_path, kind, key):
+        path = self.path(kind, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(temp_path, path)
+
+    @timed_io()
+    def put_stream(self, kind, src, suffix=''):
+        """Store a file object under its content key; returns (key, sha256)"""
+        temp_path = self.temp_path(kind)
+        digest = hashlib.sha256()
+        try:
+            with open(temp_path, 'wb') as dst:
+                for chunk in iter(lambda: src.read(1024 * 1024), b''):
+                    digest.update(chunk)
+                    dst.write(chunk)
+            key = content_key(digest.hexdigest(), suffix)
+            self.publish(temp_path, kind, key)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        return key, digest.hexdigest()
+
+    @timed_io()
+    def put_file(self, kind, incoming, suffix=''):
+        """Store an IncomingFile, hashed as it arrived, by renaming it into place; returns (key, sha256)"""
+        key = content_key(incoming.sha256(), suffix)
+        incoming.flush()
+        self.publish(incoming.path, kind, key)
+        return key, incoming.sha256()
+
+    @timed_io()
+    def put_bytes(self, kind, key, data):
+        temp_path = self.temp_path(kind)
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        self.publish(temp_path, kind, key)
+
+    def open(self, kind, key):
+        return open(self.path(kind, key), 'rb')
+
+    @contextmanager
+    def local_file(self, kind, key):
+        """A local path holding the blob, for parsers that need a real file"""
+        yield self.path(kind, key)
+
+    def url(self, kind, key, download_name=None):
+        """Direct URL for the blob; local files are sent by send_upload() instead"""
+        return None
+
+    def exists(self, kind, key):
+        return os.path.exists(self.path(kind, key))
+
+    def size(self, kind, key):
+        return os.path.getsize(self.path(kind, key))
+
+    @timed_io()
+    def delete(self, kind, key):
+        try:
+            os.remove(self.path(kind, key))
+        except FileNotFoundError:
+            pass
+
+S3_MISSING_CODES = ('404', 'NoSuchKey', 'NotFound')
+
+@contextmanager
+def s3_errors():
+    """Raise S3 failures as OSError, the way LocalStorage fails, so callers catch one type"""
+    try:
+        yield
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') in S3_MISSING_CODES:
+            raise FileNotFoundError(str(e)) from e
+        raise OSError(str(e)) from e
+    except BotoCoreError as e:
+        raise OSError(str(e)) from e
+
+class S3Storage:
+    """Blobs in an S3-compatible bucket as <S3_PREFIX><kind>/<key>
+
+    Same interface as LocalStorage. S3 makes an object visible only once it
+    is completely uploaded, so writes are atomic without a rename. Downloads
+    use presigned URLs, so the bytes never pass through the app. Client
+    errors come out as OSError (FileNotFoundError for missing objects).
+    """
+
+    def __init__(self, bucket, prefix='', endpoint_url=None, region=None, url_expires=300):
+        if boto3 is None:
+            raise RuntimeError("STORAGE_BACKEND 's3' needs boto3 (pip install boto3)")
+        if not bucket:
+            raise RuntimeError("STORAGE_BACKEND 's3' needs S3_BUCKET")
+        self.client = boto3.client('s3', endpoint_url=endpoint_url, region_name=region)
+        self.bucket = bucket
+        self.prefix = prefix
+        self.url_expires = url_expires
+
+    def object_key(self, kind, key):
+        return f"{self.prefix}{kind}/{key}"
+
+    def temp_path(self, kind):
+        """Local file that spools an upload on its way to the bucket"""
+        return os.path.join(tempfile.gettempdir(), f'library-{kind}-{uuid.uuid4().hex}')
+
+    @timed_io()
+    @s3_errors()
+    def put_stream(self, kind, src, suffix=''):
+        """Store a file object under its content key; returns (key, sha256)"""
+        # The key is the content hash, so the bytes are spooled locally while hashing
+        digest = hashlib.sha256()
+        with tempfile.TemporaryFile() as spool:
+            for chunk in iter(lambda: src.read(1024 * 1024), b''):
+                digest.update(chunk)
+                spool.write(chunk)
+            spool.seek(0)
+            key = content_key(digest.hexdigest(), suffix)
+            self.client.upload_fileobj(spool, self.bucket, self.object_key(kind, key))
+        return key, digest.hexdigest()
+
+    @timed_io()
+    @s3_errors()
+    def put_file(self, kind, incoming, suffix=''):
+        """Store an IncomingFile, hashed as it arrived; returns (key, sha256)"""
+        key = content_key(incoming.sha256(), suffix)
+        incoming.seek(0)
+        self.client.upload_fileobj(incoming.file, self.bucket, self.object_key(kind, key))
+        return key, incoming.sha256()
+
+    @timed_io()
+    @s3_errors()
+    def put_bytes(self, kind, key, data):
+        self.client.put_object(Bucket=self.bucket, Key=self.object_key(kind, key), Body=data,
+                               ContentType=mimetypes.guess_type(key)[0] or 'application/octet-stream')
+
+    @s3_errors()
+    def open(self, kind, key):
+        body = self.client.get_object(Bucket=self.bucket, Key=self.object_key(kind, key))['Body']
+        return closing(body)
+
+    @contextmanager
+    def local_file(self, kind, key):
+        """Download the blob to a temporary file for parsers that need a real file"""
+        with tempfile.NamedTemporaryFile(suffix=posixpath.splitext(key)[1]) as f:
+            with s3_errors():
+                self.client.download_fileobj(self.bucket, self.object_key(kind, key), f)
+            f.flush()
+            yield f.name
+
+    @timed_io()
+    @s3_errors()
+    def head(self, kind, key):
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self.object_key(kind, key))
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in S3_MISSING_CODES:
+                return None
+            raise
+
+    def exists(self, kind, key):
+        return self.head(kind, key) is not None
+
+    def size(self, kind, key):
+        head = self.head(kind, key)
+        if head is None:
+            raise FileNotFoundError(self.object_key(kind, key))
+        return head['ContentLength']
+
+    @timed_io()
+    @s3_errors()
+    def delete(self, kind, key):
+        # Deleting a missing object is not an error in S3
+        self.client.delete_object(Bucket=self.bucket, Key=self.object_key(kind, key))
+
+    def url(self, kind, key, download_name=None):
+        """Presigned GET URL, valid for S3_URL_EXPIRES seconds"""
+        params = {'Bucket': self.bucket, 'Key': self.object_key(kind, key)}
+        if download_name:
+            params['ResponseContentDisposition'] = \
+                f"attachment; filename=\"{secure_filename(download_name) or 'download'}\"; " \
+                f"filename*=UTF-8''{quote(download_name)}"
+        return self.client.generate_presigned_url('get_object', Params=params, ExpiresIn=self.url_expires)
+
+storage = None
+
+def get_storage():
+    """The configured blob store for books and covers"""
+    global storage
+    if storage is None and app.config['STORAGE_BACKEND'] == 's3':
+        storage = S3Storage(app.config['S3_BUCKET'], app.config['S3_PREFIX'],
+                            app.config['S3_ENDPOINT_URL'], app.config['S3_REGION'],
+                            app.config['S3_URL_EXPIRES'])
+    elif storage is None:
+        storage = LocalStorage(app.config['UPLOAD_FOLDER'])
+    return storage
+
+# Serving uploaded files
+# With X_ACCEL_REDIRECT_PREFIX set (see conf/nginx.conf), Flask only decides
+# what to send and nginx streams the file. Otherwise Flask sends it itself,
+# with ETag, Last-Modified, Range and conditional GET support.
+# Books in remote storage are redirected to presigned URLs, while covers come
+# from memory through the hot cover cache.
+class HotCoverCache:
+    """In-process LRU of cover bytes from remote storage, bounded by total size"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            data = self.entries.get(key)
+            if data is not None:
+                self.entries.move_to_end(key)
+            return data
+
+    def set(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                return
+            self.entries[key] = data
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                old_key, old_data = self.entries.popitem(last=False)
+                self.size -= len(old_data)
+
+hot_cover_cache = None
+
+def read_cover(key):
+    """Cover bytes from remote storage, through the hot cover cache"""
+    global hot_cover_cache
+    if hot_cover_cache is None:
+        hot_cover_cache = HotCoverCache(app.config['HOT_COVER_CACHE_BYTES'])
+    data = hot_cover_cache.get(key)
+    if data is None:
+        with timed_io(), get_storage().open('covers', key) as f:
+            data = f.read()
+        hot_cover_cache.set(key, data)
+    return data
+
+# Legacy cover derivatives carry a short content hash in their name, so they never change either
+HASHED_COVER_RE = re.compile(r'_[0-9a-f]{10}_\d+\.(webp|jpg)$')
+
+def send_upload(kind, key, as_attachment=False, download_name=None, max_age=None, immutable=False):
+    """Send a stored blob, offloading to nginx or the remote store when possible"""
+    # Dot segments also hide the stores' .tmp directories
+    if kind not in UPLOAD_SUBDIRS or safe_join(kind, key) is None or \
+            any(part.startswith('.') for part in key.split('/')):
+        abort(404)
+    
+    store = get_storage()
+    prefix = app.config['X_ACCEL_REDIRECT_PREFIX']
+    if not isinstance(store, LocalStorage) and kind == 'covers':
+        # Small and requested on every page: serve from memory rather than redirecting
+        try:
+            data = read_cover(key)
+        except Exception as e:
+            log.warning('Cannot read cover', extra={'key': key, 'error': str(e)})
+            abort(404)
+        response = Response(data, mimetype=mimetypes.guess_type(key)[0] or 'application/octet-stream')
+        response.set_etag(hashlib.sha1(key.encode()).hexdigest())
+        response.make_conditional(request)
+    elif not isinstance(store, LocalStorage):
+        # Books: the client fetches the bytes straight from the store
+        response = redirect(store.url(kind, key, (download_name or posixpath.basename(key))
+                                      if as_attachment else None))
+    elif prefix:
+        response = Response(mimetype=mimetypes.guess_type(key)[0] or 'application/octet-stream')
+        response.headers['X-Accel-Redirect'] = quote(f"{prefix.rstrip('/')}/{kind}/{key}")
+        if as_attachment:
+            name = download_name or posixpath.basename(key)
+            response.headers['Content-Disposition'] = \
+                f"attachment; filename=\"{secure_filename(name) or 'download'}\"; filename*=UTF-8''{quote(name)}"
+    else:
+        response = send_from_directory(os.path.join(store.root, kind), key,
+                                       as_attachment=as_attachment, download_name=download_name,
+                                       conditional=True, etag=True)
+    
+    if immutable:
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    elif max_age is not None:
+        response.headers['Cache-Control'] = f'public, max-age={max_age}'
+    return response
+
 # Route to serve uploaded files
-@app.route('/uploads/<path:subpath>/<filename>')
-def serve_uploads(subpath, filename):
-    return send_from_directory(os.path.join(app.config['UPLOAD_FOLDER'], subpath), filename)
+# Only covers are public; books go through download_book, which asks for an
+# email and records the download
+@app.route('/uploads/<kind>/<path:key>')
+def serve_uploads(kind, key):
+    if kind != 'covers':
+        abort(404)
+    return send_upload(kind, key, max_age=app.config['COVER_CACHE_MAX_AGE'],
+                       immutable=bool(SHARDED_KEY_RE.match(key) or HASHED_COVER_RE.search(key)))
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in {'pdf', 'epub'}
@@ -113,239 +1406,898 @@ def extract_metadata_from_opf(opf_path):
     try:
         with open(opf_path, 'rb') as f:
             content = f.read()
-        
-        tree = etree.fromstring(content)
-        
-        namespaces = {
-            'dc': 'http://purl.org/dc/elements/1.1/',
-            'opf': 'http://www.idpf.org/2007/opf',
-            'dc2': 'http://purl.org/dc/terms/'
-        }
-        
-        metadata = {}
-        
-        # Extract title
-        for ns_key in ['dc', 'dc2']:
-            title = tree.find(f'.//{{{namespaces[ns_key]}}}title')
-            if title is not None and title.text:
-                metadata['title'] = title.text.strip()
-                break
-        
-        # Extract author
-        for ns_key in ['dc', 'dc2']:
-            creator = tree.find(f'.//{{{namespaces[ns_key]}}}creator')
-            if creator is not None and creator.text:
-                metadata['author'] = creator.text.strip()
-                break
-        
-        # Extract description
-        for ns_key in ['dc', 'dc2']:
-            description = tree.find(f'.//{{{namespaces[ns_key]}}}description')
-            if description is not None and description.text:
-                # Strip HTML from description
-                desc_text = description.text.strip()
-                desc_text = unescape(desc_text)
-                clean = re.compile('<.*?>')
-                desc_text = re.sub(clean, '', desc_text)
-                desc_text = ' '.join(desc_text.split())
-                metadata['description'] = desc_text
-                break
-        
-        # Extract language with comprehensive mapping
-        for ns_key in ['dc', 'dc2']:
-            language = tree.find(f'.//{{{namespaces[ns_key]}}}language')
-            if language is not None and language.text:
-                lang = language.text.strip().lower()
-                
-                # Map ISO 639-2/3 codes to ISO 639-1
-                lang_map = {
-                    'en': 'en', 'eng': 'en',
-                    'ko': 'ko', 'kor': 'ko',
-                    'ar': 'ar', 'ara': 'ar',
-                    'el': 'el', 'ell': 'el', 'gre': 'el', 'grc': 'el',
-                    'zh': 'zh-cn', 'chi': 'zh-cn', 'zho': 'zh-cn',
-                    'ja': 'ja', 'jpn': 'ja',
-                    'es': 'es', 'spa': 'es',
-                    'fr': 'fr', 'fra': 'fr', 'fre': 'fr',
-                    'de': 'de', 'deu': 'de', 'ger': 'de',
-                    'it': 'it', 'ita': 'it',
-                    'pt': 'pt', 'por': 'pt',
-                    'ru': 'ru', 'rus': 'ru',
-                    'nl': 'nl', 'nld': 'nl', 'dut': 'nl',
-                    'pl': 'pl', 'pol': 'pl',
-                    'tr': 'tr', 'tur': 'tr',
-                    'sv': 'sv', 'swe': 'sv',
-                    'da': 'da', 'dan': 'da',
-                    'fi': 'fi', 'fin': 'fi',
-                    'cs': 'cs', 'ces': 'cs', 'cze': 'cs',
-                    'hu': 'hu', 'hun': 'hu',
-                    'ro': 'ro', 'ron': 'ro', 'rum': 'ro',
-                    'bg': 'bg', 'bul': 'bg',
-                    'hr': 'hr', 'hrv': 'hr',
-                    'uk': 'uk', 'ukr': 'uk',
-                    'et': 'et', 'est': 'et',
-                    'lv': 'lv', 'lav': 'lv',
-                    'lt': 'lt', 'lit': 'lt',
-                    'ca': 'ca', 'cat': 'ca',
-                }
-                
-                mapped_lang = lang_map.get(lang, lang)
-                if mapped_lang in SUPPORTED_LANGUAGES:
-                    metadata['language'] = mapped_lang
-                break
-        
-        # NEW: Extract subjects/tags from OPF
-        subjects = []
-        for ns_key in ['dc', 'dc2']:
-            subject_elements = tree.findall(f'.//{{{namespaces[ns_key]}}}subject')
-            for subject_elem in subject_elements:
-                if subject_elem.text:
-                    subjects.append(subject_elem.text.strip())
-        
-        if subjects:
-            # Join with commas and remove duplicates
-            unique_subjects = list(dict.fromkeys(subjects))  # Preserves order
-            metadata['subjects'] = ', '.join(unique_subjects)
-            print(f"Found subjects in OPF: {metadata['subjects']}")
-        
-        return metadata
     except Exception as e:
-        print(f"Error parsing OPF: {e}")
+        log.warning('Cannot read OPF', extra={'error': str(e)})
         return {}
+    return parse_opf_metadata(content)
 
-def extract_pdf_metadata(file_path):
+def parse_opf_metadata(content):
+    """Extract metadata from the bytes of an .opf file"""
     try:
-        with open(file_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            metadata = pdf_reader.metadata
-            
-            info = {}
-            if metadata:
-                if metadata.get('/Title'):
-                    info['title'] = str(metadata.get('/Title')).strip()
-                if metadata.get('/Author'):
-                    info['author'] = str(metadata.get('/Author')).strip()
-            
-            if len(pdf_reader.pages) > 0:
-                try:
-                    text = pdf_reader.pages[0].extract_text()[:500]
-                    if text and len(text) > 50:
-                        detected_lang = detect(text)
-                        if detected_lang in SUPPORTED_LANGUAGES:
-                            info['language'] = detected_lang
-                except:
-                    pass
-            
-            return info
+        return opf_tree_metadata(etree.fromstring(content))
     except Exception as e:
-        print(f"Error extracting PDF metadata: {e}")
+        log.warning('Cannot parse OPF', extra={'error': str(e)})
         return {}
 
-def extract_epub_metadata(file_path):
-    try:
-        book = epub.read_epub(file_path)
+def opf_tree_metadata(tree):
+    """Extract Dublin Core metadata from a parsed OPF document"""
+    namespaces = {
+        'dc': 'http://purl.org/dc/elements/1.1/',
+        'opf': 'http://www.idpf.org/2007/opf',
+        'dc2': 'http://purl.org/dc/terms/'
+    }
+    
+    metadata = {}
+    
+    # Extract title
+    for ns_key in ['dc', 'dc2']:
+        title = tree.find(f'.//{{{namespaces[ns_key]}}}title')
+        if title is not None and title.text:
+            metadata['title'] = title.text.strip()
+            break
+    
+    # Extract author
+    for ns_key in ['dc', 'dc2']:
+        creator = tree.find(f'.//{{{namespaces[ns_key]}}}creator')
+        if creator is not None and creator.text:
+            metadata['author'] = creator.text.strip()
+            break
+    
+    # Extract description
+    for ns_key in ['dc', 'dc2']:
+        description = tree.find(f'.//{{{namespaces[ns_key]}}}description')
+        if description is not None and description.text:
+            # Strip HTML from description
+            metadata['description'] = strip_html_tags(description.text)
+            break
+    
+    # Extract language with comprehensive mapping
+    for ns_key in ['dc', 'dc2']:
+        language = tree.find(f'.//{{{namespaces[ns_key]}}}language')
+        if language is not None and language.text:
+            lang = language.text.strip().lower()
+            
+            # Map ISO 639-2/3 codes to ISO 639-1
+            lang_map = {
+                'en': 'en', 'eng': 'en',
+                'ko': 'ko', 'kor': 'ko',
+                'ar': 'ar', 'ara': 'ar',
+                'el': 'el', 'ell': 'el', 'gre': 'el', 'grc': 'el',
+                'zh': 'zh-cn', 'chi': 'zh-cn', 'zho': 'zh-cn',
+                'ja': 'ja', 'jpn': 'ja',
+                'es': 'es', 'spa': 'es',
+                'fr': 'fr', 'fra': 'fr', 'fre': 'fr',
+                'de': 'de', 'deu': 'de', 'ger': 'de',
+                'it': 'it', 'ita': 'it',
+                'pt': 'pt', 'por': 'pt',
+                'ru': 'ru', 'rus': 'ru',
+                'nl': 'nl', 'nld': 'nl', 'dut': 'nl',
+                'pl': 'pl', 'pol': 'pl',
+                'tr': 'tr', 'tur': 'tr',
+                'sv': 'sv', 'swe': 'sv',
+                'da': 'da', 'dan': 'da',
+                'fi': 'fi', 'fin': 'fi',
+                'cs': 'cs', 'ces': 'cs', 'cze': 'cs',
+                'hu': 'hu', 'hun': 'hu',
+                'ro': 'ro', 'ron': 'ro', 'rum': 'ro',
+                'bg': 'bg', 'bul': 'bg',
+                'hr': 'hr', 'hrv': 'hr',
+                'uk': 'uk', 'ukr': 'uk',
+                'et': 'et', 'est': 'et',
+                'lv': 'lv', 'lav': 'lv',
+                'lt': 'lt', 'lit': 'lt',
+                'ca': 'ca', 'cat': 'ca',
+            }
+            
+            mapped_lang = lang_map.get(lang, lang)
+            if mapped_lang in SUPPORTED_LANGUAGES:
+                metadata['language'] = mapped_lang
+            break
+    
+    # NEW: Extract subjects/tags from OPF
+    subjects = []
+    for ns_key in ['dc', 'dc2']:
+        subject_elements = tree.findall(f'.//{{{namespaces[ns_key]}}}subject')
+        for subject_elem in subject_elements:
+            if subject_elem.text:
+                subjects.append(subject_elem.text.strip())
+    
+    if subjects:
+        # Join with commas and remove duplicates
+        unique_subjects = split_subjects(', '.join(subjects))
+        metadata['subjects'] = ', '.join(unique_subjects)
+        log.debug('Found subjects in OPF', extra={'subjects': metadata['subjects']})
+    
+    return metadata
+
+# Language detection
+# Books are sampled at several pages or chapters spread through the text, since
+# the first page is often a title page or blank. langdetect is randomized; the
+# fixed seed makes a file always get the same answer, so the content-hash
+# metadata cache stays consistent with a fresh parse.
+DetectorFactory.seed = 0
+
+def sample_positions(count, samples):
+    """Up to `samples` indexes spread evenly through range(count), away from both ends"""
+    if count <= samples:
+        return list(range(count))
+    return [count * (i + 1) // (samples + 1) for i in range(samples)]
+
+def detect_language(samples):
+    """Most likely supported language of an iterable of text samples, or None
+
+    Every sample votes with the detector's probabilities, so one odd page (a
+    quotation, a bibliography) does not decide. Samples are consumed lazily
+    and detection stops once two of them agree confidently.
+    """
+    scores = {}
+    confident = {}
+    for text in samples:
+        text = ' '.join(text.split())[:app.config['LANGUAGE_SAMPLE_CHARS']]
+        if len(text) < 50:
+            continue
+        try:
+            candidates = detect_langs(text)
+        except LangDetectException:
+            continue
+        for candidate in candidates:
+            if candidate.lang in SUPPORTED_LANGUAGES:
+                scores[candidate.lang] = scores.get(candidate.lang, 0) + candidate.prob
+        best = candidates[0]
+        if best.prob >= 0.9 and best.lang in SUPPORTED_LANGUAGES:
+            confident[best.lang] = confident.get(best.lang, 0) + 1
+            if confident[best.lang] >= 2:
+                break
+    return max(scores, key=scores.get) if scores else None
+
+def pdf_text_samples(pdf_reader):
+    """Text of the PDF pages sampled for language detection, extracted as needed"""
+    pages = pdf_reader.pages
+    for number in sample_positions(len(pages), app.config['LANGUAGE_SAMPLES']):
+        try:
+            yield pages[number].extract_text() or ''
+        except Exception as e:
+            log.warning('No text from PDF page', extra={'page': number + 1, 'error': str(e)})
+
+def epub_text_samples(zip_ref, opf_path, tree):
+    """Text of the EPUB chapters sampled for language detection, read as needed"""
+    members = epub_spine_members(opf_path, tree)
+    for index in sample_positions(len(members), app.config['LANGUAGE_SAMPLES']):
+        document = read_epub_chapter(zip_ref, members[index])
+        if document is not None:
+            body = document.find('.//body')
+            yield ' '.join((body if body is not None else document).itertext())
+
+def extract_pdf_metadata(file_path, timings):
+    """Read title, author, subjects and language from a PDF in one pass"""
+    start = time.perf_counter()
+    with open(file_path, 'rb') as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        metadata = pdf_reader.metadata
+        timings['open'] = time.perf_counter() - start
+        
+        start = time.perf_counter()
         info = {}
+        if metadata:
+            if metadata.get('/Title'):
+                info['title'] = str(metadata.get('/Title')).strip()
+            if metadata.get('/Author'):
+                info['author'] = str(metadata.get('/Author')).strip()
+            if metadata.get('/Keywords'):
+                # Calibre writes tags to the Keywords field
+                info['subjects'] = ', '.join(split_subjects(str(metadata.get('/Keywords'))))
+        timings['metadata'] = time.perf_counter() - start
         
-        title_meta = book.get_metadata('DC', 'title')
-        if title_meta and len(title_meta) > 0:
-            info['title'] = str(title_meta[0][0]).strip()
+        start = time.perf_counter()
+        language = detect_language(pdf_text_samples(pdf_reader))
+        if language:
+            info['language'] = language
+        timings['language'] = time.perf_counter() - start
         
-        author_meta = book.get_metadata('DC', 'creator')
-        if author_meta and len(author_meta) > 0:
-            info['author'] = str(author_meta[0][0]).strip()
+        return info
+
+OPF_NAMESPACE = 'http://www.idpf.org/2007/opf'
+CONTAINER_NAMESPACE = 'urn:oasis:names:tc:opendocument:xmlns:container'
+
+def find_epub_cover_href(tree):
+    """Manifest href of the cover image declared in an OPF, or None"""
+    items = tree.findall(f'.//{{{OPF_NAMESPACE}}}manifest/{{{OPF_NAMESPACE}}}item')
+    
+    # EPUB 3: <item properties="cover-image">
+    for item in items:
+        if 'cover-image' in (item.get('properties') or '').split():
+            return item.get('href')
+    
+    # EPUB 2: <meta name="cover" content="item-id"/>
+    for meta in tree.findall(f'.//{{{OPF_NAMESPACE}}}meta'):
+        if meta.get('name') == 'cover' and meta.get('content'):
+            for item in items:
+                if item.get('id') == meta.get('content'):
+                    return item.get('href')
+    
+    # Undeclared: any image whose id or file name says "cover"
+    for item in items:
+        if (item.get('media-type') or '').startswith('image/') and \
+                'cover' in f"{item.get('id', '')} {item.get('href', '')}".lower():
+            return item.get('href')
+    return None
+
+def read_epub_package(zip_ref):
+    """(OPF member name, parsed OPF) of an open EPUB archive"""
+    container = etree.fromstring(zip_ref.read('META-INF/container.xml'))
+    rootfile = container.find(f'.//{{{CONTAINER_NAMESPACE}}}rootfile')
+    opf_path = rootfile.get('full-path')
+    return opf_path, etree.fromstring(zip_ref.read(opf_path))
+
+def extract_epub_metadata_fast(file_path, timings):
+    """Read an EPUB's metadata and cover from the ZIP directly
+
+    Only META-INF/container.xml, the OPF package document and the cover image
+    are decompressed; chapters and other images are never read. Raises on
+    anything unexpected so the caller can fall back to ebooklib.
+    """
+    start = time.perf_counter()
+    with zipfile.ZipFile(file_path, 'r') as zip_ref:
+        opf_path, tree = read_epub_package(zip_ref)
+        timings['open'] = time.perf_counter() - start
         
-        desc_meta = book.get_metadata('DC', 'description')
-        if desc_meta and len(desc_meta) > 0:
-            info['description'] = str(desc_meta[0][0]).strip()
+        start = time.perf_counter()
+        info = opf_tree_metadata(tree)
+        timings['metadata'] = time.perf_counter() - start
         
-        lang_meta = book.get_metadata('DC', 'language')
-        if lang_meta and len(lang_meta) > 0:
-            lang = str(lang_meta[0][0]).strip().lower()
-            if lang.startswith('en'):
-                lang = 'en'
-            if lang in SUPPORTED_LANGUAGES:
-                info['language'] = lang
+        start = time.perf_counter()
+        cover_href = find_epub_cover_href(tree)
+        if cover_href:
+            # Manifest hrefs are URL-encoded and relative to the OPF
+            cover_member = posixpath.normpath(posixpath.join(posixpath.dirname(opf_path), unquote(cover_href)))
+            try:
+                info['cover'] = zip_ref.read(cover_member)
+            except KeyError:
+                log.warning('EPUB cover missing', extra={'member': cover_member, 'path': file_path})
+        timings['cover'] = time.perf_counter() - start
         
-        return info
-    except Exception as e:
-        print(f"Error extracting EPUB metadata: {e}")
-        return {}
+        # Only books that don't declare their language need their text read
+        if not info.get('language'):
+            start = time.perf_counter()
+            language = detect_language(epub_text_samples(zip_ref, opf_path, tree))
+            if language:
+                info['language'] = language
+            timings['language'] = time.perf_counter() - start
+    
+    return info
 
-def extract_epub_cover(file_path, cover_filename):
+def extract_epub_metadata(file_path, timings):
+    """Read EPUB metadata via the fast ZIP reader, falling back to ebooklib"""
     try:
-        book = epub.read_epub(file_path)
-        for item in book.get_items():
-            if item.get_type() == ebooklib.ITEM_COVER or 'cover' in item.get_name().lower():
-                cover_path = os.path.join(app.config['UPLOAD_FOLDER'], 'covers', cover_filename)
-                with open(cover_path, 'wb') as f:
-                    f.write(item.get_content())
-                return cover_filename
+        return extract_epub_metadata_fast(file_path, timings)
     except Exception as e:
-        print(f"Error extracting EPUB cover: {e}")
-    return None
+        log.info('Fast EPUB reader failed, using ebooklib', extra={'error': str(e)})
+        timings.clear()
+        return extract_epub_metadata_ebooklib(file_path, timings)
 
-def process_calibre_book(book_folder_path):
-    """Process a single book from Calibre export"""
-    metadata = {}
-    book_file = None
-    opf_file = None
-    cover_file = None
-    
-    # Find book file, OPF, and cover
-    for filename in os.listdir(book_folder_path):
-        file_path = os.path.join(book_folder_path, filename)
-        if filename.endswith('.opf'):
-            opf_file = file_path
-        elif filename.endswith(('.pdf', '.epub')):
-            book_file = file_path
-        elif filename.lower().endswith(('.jpg', '.jpeg', '.png')):
-            # Accept any image file as potential cover
-            if not cover_file or 'cover' in filename.lower():
-                cover_file = file_path
+def extract_epub_metadata_ebooklib(file_path, timings):
+    """Read Dublin Core metadata and the cover image from an EPUB in one pass"""
+    start = time.perf_counter()
+    book = epub.read_epub(file_path)
+    timings['open'] = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    info = {}
+    
+    title_meta = book.get_metadata('DC', 'title')
+    if title_meta and len(title_meta) > 0:
+        info['title'] = str(title_meta[0][0]).strip()
+    
+    author_meta = book.get_metadata('DC', 'creator')
+    if author_meta and len(author_meta) > 0:
+        info['author'] = str(author_meta[0][0]).strip()
+    
+    desc_meta = book.get_metadata('DC', 'description')
+    if desc_meta and len(desc_meta) > 0:
+        info['description'] = str(desc_meta[0][0]).strip()
+    
+    lang_meta = book.get_metadata('DC', 'language')
+    if lang_meta and len(lang_meta) > 0:
+        lang = str(lang_meta[0][0]).strip().lower()
+        if lang.startswith('en'):
+            lang = 'en'
+        if lang in SUPPORTED_LANGUAGES:
+            info['language'] = lang
+    
+    subject_meta = book.get_metadata('DC', 'subject')
+    if subject_meta:
+        info['subjects'] = ', '.join(split_subjects(', '.join(str(s[0]) for s in subject_meta)))
+    timings['metadata'] = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    for item in book.get_items():
+        if item.get_type() == ebooklib.ITEM_COVER or 'cover' in item.get_name().lower():
+            info['cover'] = item.get_content()
+            break
+    timings['cover'] = time.perf_counter() - start
     
-    if not book_file:
+    return info
+
+# Book text extraction, for the in-book search index
+def split_text_chunks(text, size):
+    """Split text into whitespace-normalized pieces of about `size` characters"""
+    chunks, words, length = [], [], 0
+    for word in text.split():
+        words.append(word)
+        length += len(word) + 1
+        if length >= size:
+            chunks.append(' '.join(words))
+            words, length = [], 0
+    if words:
+        chunks.append(' '.join(words))
+    return chunks
+
+def extract_pdf_text(file_path, chunk_chars):
+    """(location, text) pieces of a PDF, page by page"""
+    chunks = []
+    with open(file_path, 'rb') as file:
+        for number, page in enumerate(PyPDF2.PdfReader(file).pages, 1):
+            try:
+                text = page.extract_text() or ''
+            except Exception as e:
+                log.warning('No text from PDF page', extra={'page': number, 'path': file_path, 'error': str(e)})
+                continue
+            chunks.extend((f'p. {number}', chunk) for chunk in split_text_chunks(text, chunk_chars))
+    return chunks
+
+def epub_spine_members(opf_path, tree):
+    """Archive members of an EPUB's (X)HTML chapters, in reading order"""
+    manifest = {item.get('id'): item
+                for item in tree.findall(f'.//{{{OPF_NAMESPACE}}}manifest/{{{OPF_NAMESPACE}}}item')}
+    members = []
+    for itemref in tree.findall(f'.//{{{OPF_NAMESPACE}}}spine/{{{OPF_NAMESPACE}}}itemref'):
+        item = manifest.get(itemref.get('idref'))
+        if item is not None and 'html' in (item.get('media-type') or '') and item.get('href'):
+            members.append(posixpath.normpath(posixpath.join(posixpath.dirname(opf_path), unquote(item.get('href')))))
+    return members
+
+def read_epub_chapter(zip_ref, member):
+    """Parsed chapter without scripts and styles, or None when it is missing or unreadable"""
+    try:
+        # The HTML parser copes with the sloppy XHTML many EPUBs contain
+        document = etree.fromstring(zip_ref.read(member), etree.HTMLParser())
+    except (KeyError, etree.LxmlError) as e:
+        log.warning('Skipping unreadable EPUB chapter', extra={'member': member, 'error': str(e)})
         return None
+    if document is not None:
+        etree.strip_elements(document, 'script', 'style', with_tail=False)
+    return document
+
+def extract_epub_text(file_path, chunk_chars):
+    """(location, text) pieces of an EPUB, chapter by chapter in reading order"""
+    chunks = []
+    with zipfile.ZipFile(file_path, 'r') as zip_ref:
+        opf_path, tree = read_epub_package(zip_ref)
+        for number, member in enumerate(epub_spine_members(opf_path, tree), 1):
+            document = read_epub_chapter(zip_ref, member)
+            if document is None:
+                continue
+            heading = next(iter(document.xpath('//h1|//h2|//title')), None)
+            heading_text = ' '.join(' '.join(heading.itertext()).split()) if heading is not None else ''
+            location = heading_text[:200] if heading_text else f'Chapter {number}'
+            body = document.find('.//body')
+            text = ' '.join((body if body is not None else document).itertext())
+            chunks.extend((location, chunk) for chunk in split_text_chunks(text, chunk_chars))
+    return chunks
+
+def extract_book_text(item):
+    """Pool worker: (book_id, [(location, text), ...]) for one stored book"""
+    book_id, filename, file_type = item
+    try:
+        with get_storage().local_file('books', filename) as file_path:
+            if file_type == 'pdf':
+                return book_id, extract_pdf_text(file_path, app.config['CONTENT_CHUNK_CHARS'])
+            if file_type == 'epub':
+                return book_id, extract_epub_text(file_path, app.config['CONTENT_CHUNK_CHARS'])
+    except Exception as e:
+        log.warning('Cannot extract book text', extra={'book_id': book_id, 'error': str(e)})
+    return book_id, []
+
+# Bump when the extractor's output changes, so stale cache entries are ignored
+METADATA_CACHE_VERSION = 4
+
+def file_sha256(file_path):
+    """SHA-256 of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def metadata_cache_paths(content_hash):
+    """(metadata JSON, cover bytes) cache file paths for a content hash"""
+    base = os.path.join(app.config['METADATA_CACHE_FOLDER'],
+                        f"{content_hash}.v{METADATA_CACHE_VERSION}")
+    return base + '.json', base + '.cover'
+
+def load_cached_metadata(content_hash):
+    json_path, cover_path = metadata_cache_paths(content_hash)
+    try:
+        with open(json_path) as f:
+            info = json.load(f)
+        if info.pop('has_cover', False):
+            with open(cover_path, 'rb') as f:
+                info['cover'] = f.read()
+        return info
+    except (OSError, ValueError):
+        return None
+
+def store_cached_metadata(content_hash, info):
+    json_path, cover_path = metadata_cache_paths(content_hash)
+    os.makedirs(os.path.dirname(json_path), exist_ok=True)
+    data = {k: v for k, v in info.items() if k not in ('cover', 'timings', 'cached')}
+    data['has_cover'] = info.get('cover') is not None
+    # Write the cover first and rename into place, so readers never see half a cache entry
+    if data['has_cover']:
+        with open(cover_path + '.part', 'wb') as f:
+            f.write(info['cover'])
+        os.replace(cover_path + '.part', cover_path)
+    with open(json_path + '.part', 'w') as f:
+        json.dump(data, f)
+    os.replace(json_path + '.part', json_path)
+
+def extract_book_metadata(file_path, file_type, content_hash=None):
+    """Extract metadata and cover from a book, opening the file only once
+
+    Returns title, author, description, language and subjects when found,
+    plus 'cover' bytes, a 'timings' breakdown in seconds per
+    stage and 'cached'. Results are cached by content hash, so importing the
+    same file again skips parsing.
+    """
+    timings = {}
+    start = time.perf_counter()
+    if content_hash is None:
+        content_hash = file_sha256(file_path)
+    timings['hash'] = time.perf_counter() - start
+    
+    info = load_cached_metadata(content_hash)
+    if info is not None:
+        info['timings'] = timings
+        info['cached'] = True
+        return info
     
-    # Extract metadata from OPF first
-    if opf_file:
-        metadata = extract_metadata_from_opf(opf_file)
-        print(f"OPF metadata for {book_folder_path}: {metadata}")
-    
-    # Get file info
-    filename = os.path.basename(book_file)
-    file_type = filename.rsplit('.', 1)[1].lower()
+    try:
+        if file_type == 'pdf':
+            info = extract_pdf_metadata(file_path, timings)
+        elif file_type == 'epub':
+            info = extract_epub_metadata(file_path, timings)
+        else:
+            info = {}
+    except Exception as e:
+        log.warning('Metadata extraction failed', extra={'file_type': file_type, 'error': str(e)})
+        # Don't cache failures: the parser may be fixed in a later release
+        return {'timings': timings, 'cached': False}
     
-    # Extract metadata from book if OPF didn't provide it
-    if file_type == 'pdf':
-        book_metadata = extract_pdf_metadata(book_file)
-    elif file_type == 'epub':
-        book_metadata = extract_epub_metadata(book_file)
-    else:
-        book_metadata = {}
+    try:
+        store_cached_metadata(content_hash, info)
+    except OSError as e:
+        log.warning('Cannot cache metadata', extra={'error': str(e)})
     
-    for key in ['title', 'author', 'description', 'language']:
+    info['timings'] = timings
+    info['cached'] = False
+    return info
+
+def merge_book_metadata(metadata, book_metadata):
+    """Fill fields missing from OPF metadata with those read from the book itself"""
+    for key in ['title', 'author', 'description', 'language', 'subjects']:
         if key not in metadata or not metadata.get(key):
             if key in book_metadata and book_metadata.get(key):
                 metadata[key] = book_metadata[key]
+    return metadata
+
+# Cover derivatives
+# Covers are decoded once at ingest and stored only as resized derivatives
+# named cover_<base>_<hash>_<width>.<ext>; Book.cover_image names the largest one.
+COVER_FORMATS = {'webp': ('WEBP', '.webp'), 'jpeg': ('JPEG', '.jpg')}
+
+def cover_output_format():
+    """(Pillow format, file extension) for new cover derivatives"""
+    fmt = app.config['COVER_FORMAT']
+    if fmt == 'webp' and not features.check('webp'):
+        fmt = 'jpeg'
+    return COVER_FORMATS[fmt]
+
+def save_cover(data, label):
+    """Decode cover image bytes and write its fixed-width derivatives
+
+    The image type is sniffed from its content, not its file name. Returns
+    (cover_image, cover_widths) for the Book, or (None, None) when the data
+    is not an image Pillow can read. `label` only names the book in logs.
+    """
+    try:
+        image = Image.open(BytesIO(data))
+        image.load()
+    except Exception as e:
+        log.warning('Unreadable cover image', extra={'label': label, 'error': str(e)})
+        return None, None
+    
+    if image.mode not in ('RGB', 'L'):
+        # Flatten transparency onto white; neither output format needs alpha
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image.convert('RGBA'), mask=image.convert('RGBA').split()[-1])
+        image = background
+    
+    pil_format, ext = cover_output_format()
+    # Keyed by the source image's hash: every derivative URL is immutable, so browsers
+    # can cache it forever, and books with the same cover share its files
+    base_key = content_key(hashlib.sha256(data).hexdigest())
+    
+    # Never upscale: widths beyond the source collapse into one derivative at full size
+    widths = sorted({min(w, image.width) for w in app.config['COVER_WIDTHS']})
+    for width in widths:
+        height = max(1, round(image.height * width / image.width))
+        resized = image.resize((width, height), Image.LANCZOS) if width < image.width else image
+        output = BytesIO()
+        resized.save(output, pil_format, quality=82)
+        get_storage().put_bytes('covers', f"{base_key}_{width}{ext}", output.getvalue())
+    
+    return f"{base_key}_{widths[-1]}{ext}", ','.join(str(w) for w in widths)
+
+def cover_variants(book):
+    """(width, filename) for each stored derivative of a book's cover"""
+    if not book.cover_image:
+        return []
+    if not book.cover_widths:
+        return [(None, book.cover_image)]  # Legacy cover without derivatives
+    base, ext = os.path.splitext(book.cover_image)
+    base = base.rsplit('_', 1)[0]
+    return [(int(w), f"{base}_{w}{ext}") for w in book.cover_widths.split(',')]
+
+@app.template_global()
+def cover_url(book, width=None):
+    """URL of the smallest cover derivative at least `width` wide (largest if None)"""
+    variants = cover_variants(book)
+    if not variants:
+        return None
+    filename = variants[-1][1]
+    if width:
+        filename = next((f for w, f in variants if w and w >= width), filename)
+    return url_for('serve_uploads', kind='covers', key=filename)
+
+@app.template_global()
+def cover_srcset(book):
+    """srcset attribute value listing every cover derivative"""
+    return ', '.join(f"{url_for('serve_uploads', kind='covers', key=f)} {w}w"
+                     for w, f in cover_variants(book) if w)
+
+def delete_cover_files(book):
+    """Remove every stored derivative of a book's cover, unless a linked duplicate uses it"""
+    if book.cover_image and Book.query.filter(Book.cover_image == book.cover_image,
+                                              Book.id != book.id).first():
+        return
+    for width, filename in cover_variants(book):
+        get_storage().delete('covers', filename)
+
+@app.cli.command('generate-cover-thumbnails')
+@click.option('--force', is_flag=True, help='Also regenerate books that already have derivatives.')
+def generate_cover_thumbnails_command(force):
+    """Create resized cover derivatives for existing books."""
+    init_db()
+    query = Book.query.filter(Book.cover_image.isnot(None))
+    if not force:
+        query = query.filter(Book.cover_widths.is_(None))
+    
+    done = failed = 0
+    for book in query.order_by(Book.id).all():
+        # Regenerate from the original, or from the largest derivative when re-running
+        try:
+            with get_storage().open('covers', book.cover_image) as f:
+                data = f.read()
+        except OSError as e:
+            print(f"Book {book.id}: cannot read cover: {e}")
+            failed += 1
+            continue
+        
+        old_cover = book.cover_image
+        old_files = {filename for width, filename in cover_variants(book)}
+        cover_image, cover_widths = save_cover(data, f'book {book.id}')
+        if not cover_image:
+            failed += 1
+            continue
+        # Linked duplicates share the cover files, so move them along too
+        Book.query.filter(Book.cover_image == old_cover).update(
+            {'cover_image': cover_image, 'cover_widths': cover_widths}, synchronize_session=False)
+        book.cover_image, book.cover_widths = cover_image, cover_widths
+        bump_catalogue_version()
+        db.session.commit()
+        
+        # Drop the full-size original and any derivatives no longer in use
+        for filename in old_files - {f for w, f in cover_variants(book)}:
+            get_storage().delete('covers', filename)
+        done += 1
     
-    print(f"Final metadata: {metadata}")
+    print(f'Generated cover derivatives for {done} books ({failed} failed)')
+
+@app.cli.command('migrate-storage')
+@click.option('--dry-run', is_flag=True, help='Only count what would be moved.')
+def migrate_storage_command(dry_run):
+    """Move flat-named books and covers into the content-addressed layout."""
+    init_db()
+    store = get_storage()
+    moved = missing = 0
+    
+    # Each blob is copied to its new key and the records committed before the old
+    # file goes, so an interrupted run never leaves a book without its file.
+    # Cached pages link to the old names, so each move also bumps the catalogue.
+    filenames = [name for (name,) in db.session.query(Book.filename).distinct()
+                 if not SHARDED_KEY_RE.match(name)]
+    for filename in filenames:
+        if not store.exists('books', filename):
+            print(f"Missing book file: {filename}")
+            missing += 1
+            continue
+        moved += 1
+        if dry_run:
+            continue
+        with store.open('books', filename) as f:
+            key, content_hash = store.put_stream('books', f, os.path.splitext(filename)[1].lower())
+        Book.query.filter_by(filename=filename).update(
+            {'filename': key, 'content_hash': content_hash}, synchronize_session=False)
+        bump_catalogue_version()
+        db.session.commit()
+        store.delete('books', filename)
+    
+    covers = db.session.query(Book.cover_image, Book.cover_widths) \
+        .filter(Book.cover_image.isnot(None)).distinct().all()
+    for cover_image, cover_widths in covers:
+        if SHARDED_KEY_RE.match(cover_image):
+            continue
+        variants = cover_variants(Book(cover_image=cover_image, cover_widths=cover_widths))
+        if not all(store.exists('covers', filename) for width, filename in variants):
+            print(f"Missing cover files: {cover_image}")
+            missing += 1
+            continue
+        moved += 1
+        if dry_run:
+            continue
+        # The largest derivative stands in for the source image the name was hashed from
+        with store.open('covers', cover_image) as f:
+            data = f.read()
+        base_key = content_key(hashlib.sha256(data).hexdigest())
+        ext = os.path.splitext(cover_image)[1].lower()
+        new_names = {}
+        for width, filename in variants:
+            new_names[filename] = f"{base_key}_{width}{ext}" if width else f"{base_key}{ext}"
+            with store.open('covers', filename) as f:
+                store.put_bytes('covers', new_names[filename], f.read())
+        Book.query.filter_by(cover_image=cover_image).update(
+            {'cover_image': new_names[cover_image]}, synchronize_session=False)
+        bump_catalogue_version()
+        db.session.commit()
+        for filename in new_names:
+            store.delete('covers', filename)
     
-    return {
-        'book_file': book_file,
-        'cover_file': cover_file,
-        'metadata': metadata,
-        'file_type': file_type
+    action = 'Would move' if dry_run else 'Moved'
+    print(f'{action} {moved} books and covers to content-addressed storage ({missing} missing)')
+
+# Catalogue page cache
+# Public listings are cached per (search, language, subject, cursor, page
+# size) and per catalogue version. Every change to books or links bumps the
+# version in SiteSettings (shared by all workers), which orphans old entries.
+CATALOGUE_CACHE_ARGS = ('search', 'language', 'subject', 'cursor', 'per_page')
+
+def get_catalogue_state():
+    """(version, last modified) of the public catalogue"""
+    rows = dict(db.session.query(SiteSettings.key, SiteSettings.value)
+                .filter(SiteSettings.key.in_(['catalogue_version', 'catalogue_modified'])))
+    version = int(rows.get('catalogue_version') or 0)
+    modified = datetime.fromisoformat(rows['catalogue_modified']) if rows.get('catalogue_modified') else None
+    return version, modified
+
+def bump_catalogue_version():
+    """Invalidate cached catalogue pages; runs in the caller's transaction"""
+    db.session.execute(
+        db.update(SiteSettings).where(SiteSettings.key == 'catalogue_version')
+        .values(value=db.cast(db.cast(SiteSettings.value, db.Integer) + 1, db.Text)))
+    db.session.execute(
+        db.update(SiteSettings).where(SiteSettings.key == 'catalogue_modified')
+        .values(value=datetime.utcnow().replace(microsecond=0).isoformat()))
+
+def init_catalogue_version():
+    """Create the catalogue version settings if this database has none yet"""
+    defaults = {
+        'catalogue_version': ('0', 'Bumped on every catalogue change; keys the page cache'),
+        'catalogue_modified': (datetime.utcnow().replace(microsecond=0).isoformat(), 'Last catalogue change (UTC)'),
     }
+    for key, (value, description) in defaults.items():
+        if SiteSettings.query.filter_by(key=key).first() is None:
+            db.session.add(SiteSettings(key=key, value=value, description=description))
+    db.session.commit()
 
-@app.route('/')
-def index():
-    search_query = request.args.get('search', '')
-    language_filter = request.args.get('language', '')
-    subject_filter = request.args.get('subject', '')  # NEW: Add subject filter
-    
+class MemoryPageCache:
+    """In-process LRU of rendered pages, emptied when the catalogue version changes"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.version = None
+        self.lock = threading.Lock()
+
+    def get(self, version, key):
+        with self.lock:
+            if version != self.version:
+                return None
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def set(self, version, key, entry):
+        with self.lock:
+            if version != self.version:
+                self.entries.clear()
+                self.version = version
+            self.entries[key] = entry
+            if len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+class DiskPageCache:
+    """Rendered pages on disk, shared by every worker; one directory per catalogue version
+
+    Writes are best-effort: another worker may be removing an old version's
+    directory at the same moment, and a page that can't be stored is simply
+    served uncached.
+    """
+
+    def __init__(self, folder, grace_seconds=300):
+        self.folder = folder
+        self.grace_seconds = grace_seconds
+
+    def path(self, version, key):
+        return os.path.join(self.folder, f'v{version}', hashlib.sha256(key.encode()).hexdigest())
+
+    def get(self, version, key):
+        try:
+            with open(self.path(version, key), 'rb') as f:
+                mimetype, body = f.read().split(b'\n', 1)
+            return body, mimetype.decode()
+        except (OSError, ValueError):
+            return None
+
+    def set(self, version, key, entry):
+        body, mimetype = entry
+        path = self.path(version, key)
+        if not os.path.isdir(os.path.dirname(path)):
+            self.prune(version)
+        part_path = f'{path}.{uuid.uuid4().hex}.part'
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(part_path, 'wb') as f:
+                f.write(mimetype.encode() + b'\n' + body)
+            os.replace(part_path, path)
+        except OSError as e:
+            log.warning('Cannot cache page', extra={'path': path, 'error': str(e)})
+            if os.path.exists(part_path):
+                os.remove(part_path)
+
+    def prune(self, version):
+        """Remove other versions' directories that nothing has written to for grace_seconds
+
+        Workers still on an older version (their request started before the
+        bump) keep writing to its directory for a moment; leaving recently
+        used directories alone keeps their writes from failing.
+        """
+        idle_since = time.time() - self.grace_seconds
+        for name in os.listdir(self.folder) if os.path.isdir(self.folder) else []:
+            path = os.path.join(self.folder, name)
+            try:
+                if name != f'v{version}' and os.path.getmtime(path) < idle_since:
+                    shutil.rmtree(path, ignore_errors=True)
+            except OSError:
+                continue  # Removed by another worker
+
+page_cache = None
+
+def get_page_cache():
+    """The configured page cache backend, or None when caching is off"""
+    global page_cache
+    backend = app.config['PAGE_CACHE_BACKEND']
+    if page_cache is None and backend == 'memory':
+        page_cache = MemoryPageCache(app.config['PAGE_CACHE_SIZE'])
+    elif page_cache is None and backend == 'disk':
+        page_cache = DiskPageCache(app.config['PAGE_CACHE_FOLDER'], app.config['PAGE_CACHE_GRACE_SECONDS'])
+    return page_cache
+
+def cached_page(view):
+    """Serve a catalogue view from the page cache, with ETag/Last-Modified revalidation"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        cache = get_page_cache()
+        # Pending flash messages are rendered into the page, so it can't be shared
+        if cache is None or '_flashes' in session:
+            return view(*args, **kwargs)
+        
+        version, modified = get_catalogue_state()
+        key = '|'.join([request.endpoint] + [request.args.get(arg, '') for arg in CATALOGUE_CACHE_ARGS])
+        etag = hashlib.sha1(f'{version}|{key}'.encode()).hexdigest()
+        
+        if etag in request.if_none_match:
+            metrics.inc('library_page_cache_total', {'result': 'not_modified'})
+            response = Response(status=304)
+        else:
+            entry = cache.get(version, key)
+            metrics.inc('library_page_cache_total', {'result': 'miss' if entry is None else 'hit'})
+            if entry is None:
+                response = app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                entry = (response.get_data(), response.mimetype)
+                cache.set(version, key, entry)
+            body, mimetype = entry
+            response = Response(body, mimetype=mimetype)
+        
+        response.set_etag(etag)
+        if modified:
+            response.last_modified = modified
+        # Shared caches may store the page but must revalidate it on every use
+        response.headers['Cache-Control'] = 'public, no-cache'
+        return response.make_conditional(request)
+    return wrapper
+
+# Catalogue listing and pagination
+def get_page_size(config_key):
+    """Page size from ?per_page=, defaulting to and bounded by the app config"""
+    per_page = request.args.get('per_page', type=int) or app.config[config_key]
+    return max(1, min(per_page, app.config['MAX_BOOKS_PER_PAGE']))
+
+def encode_cursor(book=None, offset=None):
+    """Opaque cursor: a (upload_date, id) position, or an offset for ranked results"""
+    if offset is not None:
+        raw = f'@{offset}'
+    else:
+        raw = f'{book.upload_date.isoformat()}|{book.id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor(); returns None for a missing or malformed cursor"""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        if raw.startswith('@'):
+            return int(raw[1:])
+        upload_date, book_id = raw.split('|')
+        return datetime.fromisoformat(upload_date), int(book_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+def paginate_books(query, cursor, per_page, ranked=False):
+    """Return one page of books and the cursor for the next page (or None)
+
+    Plain listings use keyset pagination on (upload_date, id), newest first,
+    so every page costs the same regardless of depth. Search results are in
+    relevance order, which has no stable key, so they page by offset.
+    """
+    position = decode_cursor(cursor)
+    query = query.order_by(Book.upload_date.desc(), Book.id.desc())
+
+    if ranked:
+        offset = position if isinstance(position, int) else 0
+        books = query.offset(offset).limit(per_page + 1).all()
+        next_cursor = encode_cursor(offset=offset + per_page) if len(books) > per_page else None
+        return books[:per_page], next_cursor
+
+    if isinstance(position, tuple):
+        query = query.filter(db.tuple_(Book.upload_date, Book.id) < position)
+    books = query.limit(per_page + 1).all()
+    next_cursor = encode_cursor(books[per_page - 1]) if len(books) > per_page else None
+    return books[:per_page], next_cursor
+
+def filter_books(search_query, language_filter, subject_filter):
+    """Build the catalogue query; returns (query, ranked)"""
     query = Book.query
-    
-    if search_query:
+    ranked = False
+
+    if search_query and app.config.get('FTS_ENABLED'):
+        # Ranked full-text search; results come back best match first
+        query = search_books(query, search_query)
+        ranked = True
+    elif search_query:
         search_pattern = f'%{search_query}%'
         query = query.filter(
             db.or_(
@@ -355,20 +2307,47 @@ def index():
                 Book.subjects.ilike(search_pattern)  # Also search in subjects
             )
         )
-    
+
     if language_filter:
         query = query.filter(Book.language == language_filter)
-    
-    # NEW: Filter by subject if provided
+
+    # NEW: Filter by subject if provided (exact match on the subject index)
     if subject_filter:
-        query = query.filter(Book.subjects.ilike(f'%{subject_filter}%'))
-    
-    books = query.order_by(Book.upload_date.desc()).all()
-    
+        query = query.filter(Book.subject_tags.any(Subject.name == subject_filter))
+
+    return query, ranked
+
+def book_to_dict(book):
+    """JSON-friendly summary of a book for listing endpoints"""
+    return {
+        'id': book.id,
+        'title': book.title,
+        'author': book.author,
+        'language': book.language,
+        'file_type': book.file_type,
+        'subjects': split_subjects(book.subjects),
+        'upload_date': book.upload_date.isoformat() if book.upload_date else None,
+        'cover_url': cover_url(book, 320),
+        'cover_srcset': cover_srcset(book),
+        'url': url_for('book_page', book_id=book.id),
+    }
+
+@app.route('/')
+@cached_page
+def index():
+    search_query = request.args.get('search', '')
+    language_filter = request.args.get('language', '')
+    subject_filter = request.args.get('subject', '')  # NEW: Add subject filter
+    cursor = request.args.get('cursor', '')
+    per_page = get_page_size('BOOKS_PER_PAGE')
+
+    query, ranked = filter_books(search_query, language_filter, subject_filter)
+    books, next_cursor = paginate_books(query, cursor, per_page, ranked)
+
     languages = db.session.query(Book.language).distinct().all()
     languages = [lang[0] for lang in languages if lang[0]]
     
-    # NEW: Get all subjects dynamically from database
+    # NEW: Get all subjects with their book counts
     all_subjects = get_all_subjects()
     
     # Get social and donation links
@@ -382,14 +2361,37 @@ def index():
                          selected_language=language_filter,
                          subjects=all_subjects,  # NEW: Pass subjects to template
                          selected_subject=subject_filter,  # NEW: Pass selected subject
+                         next_cursor=next_cursor,
+                         is_first_page=not cursor,
+                         per_page=per_page,
                          social_links=social_links, 
                          donation_links=donation_links)
 
+@app.route('/api/books')
+@cached_page
+def api_books():
+    """JSON catalogue listing, one page per call, for infinite scroll"""
+    query, ranked = filter_books(request.args.get('search', ''),
+                                 request.args.get('language', ''),
+                                 request.args.get('subject', ''))
+    books, next_cursor = paginate_books(query, request.args.get('cursor', ''),
+                                        get_page_size('BOOKS_PER_PAGE'), ranked)
+    return jsonify({
+        'books': [book_to_dict(book) for book in books],
+        'next_cursor': next_cursor,
+    })
+
 @app.route('/book/<int:book_id>')
 def book_page(book_id):
     book = Book.query.get_or_404(book_id)
     return render_template('book_page.html', book=book)
 
+def download_filename(book):
+    """File name offered for a download; stored keys are content hashes"""
+    if not SHARDED_KEY_RE.match(book.filename):
+        return book.filename
+    return f"{book.title}.{book.file_type}"
+
 @app.route('/download/<int:book_id>', methods=['POST'])
 def download_book(book_id):
     book = Book.query.get_or_404(book_id)
@@ -399,12 +2401,9 @@ def download_book(book_id):
         flash('Email is required to download', 'error')
         return redirect(url_for('book_page', book_id=book_id))
     
-    download = Download(book_id=book_id, email=email)
-    db.session.add(download)
-    db.session.commit()
+    download_log.record(book_id, email)
     
-    file_path = os.path.join(app.config['UPLOAD_FOLDER'], 'books', book.filename)
-    return send_file(file_path, as_attachment=True, download_name=book.filename)
+    return send_upload('books', book.filename, as_attachment=True, download_name=download_filename(book))
 
 @app.route('/admin', methods=['GET', 'POST'])
 def admin():
@@ -417,10 +2416,82 @@ def admin():
     
     return render_template('login.html')
 
+# Admin catalogue
+# The admin panel renders its first page of books like the catalogue does and
+# loads further pages, filtered and sorted on the server, from /admin/api/books.
+# Rows carry no edit forms: the one edit form is filled from
+# /admin/api/books/<id> when Edit is clicked, so only the book being edited
+# sends its description.
+ADMIN_SORTS = {
+    'newest': (Book.upload_date.desc(), Book.id.desc()),
+    'oldest': (Book.upload_date.asc(), Book.id.asc()),
+    'title': (db.func.lower(Book.title), Book.id),
+    'author': (db.func.lower(Book.author), db.func.lower(Book.title), Book.id),
+}
+
+def admin_filters():
+    """The admin listing's search, language, subject and sort arguments that are set"""
+    return {name: request.args[name].strip() for name in ('search', 'language', 'subject', 'sort')
+            if request.args.get(name, '').strip()}
+
+def admin_book_query(filters):
+    """Filtered and sorted admin listing; returns (query, ranked, sort) for paginate_books()"""
+    query, ranked = filter_books(filters.get('search', ''), filters.get('language', ''),
+                                 filters.get('subject', ''))
+    sort = filters.get('sort')
+    if sort not in ADMIN_SORTS and not (sort == 'relevance' and ranked):
+        sort = 'relevance' if ranked else 'newest'
+    if sort != 'relevance' and (ranked or sort != 'newest'):
+        # Only newest first has a keyset; other orders page by offset like search results
+        query = query.order_by(None).order_by(*ADMIN_SORTS[sort])
+        ranked = True
+    return query, ranked, sort
+
+def admin_book_dict(book):
+    """Listing entry for the admin panel: book_to_dict() plus the admin URLs"""
+    return dict(book_to_dict(book),
+                subjects=book.subjects or '',
+                admin_url=url_for('admin_book', book_id=book.id),
+                edit_url=url_for('edit_book', book_id=book.id),
+                delete_url=url_for('delete_book', book_id=book.id))
+
+@app.route('/admin/api/books')
+def admin_api_books():
+    """Admin listing as JSON, one page per call; ?search=, ?language=, ?subject=, ?sort=, ?cursor="""
+    filters = admin_filters()
+    query, ranked, sort = admin_book_query(filters)
+    cursor = request.args.get('cursor', '')
+    books, next_cursor = paginate_books(query, cursor, get_page_size('ADMIN_BOOKS_PER_PAGE'), ranked)
+    result = {
+        'books': [admin_book_dict(book) for book in books],
+        'next_cursor': next_cursor,
+        'sort': sort,
+    }
+    if not cursor:
+        # Counting visits every match, so only the first page pays for it
+        result['total'] = query.order_by(None).count()
+    return jsonify(result)
+
+@app.route('/admin/api/books/<int:book_id>')
+def admin_book(book_id):
+    """Everything the edit form needs about one book"""
+    book = Book.query.get_or_404(book_id)
+    return jsonify(dict(admin_book_dict(book),
+                        description=book.description or '',
+                        content_hash=book.content_hash,
+                        downloads=db.session.query(db.func.sum(DailyDownloads.downloads))
+                            .filter(DailyDownloads.book_id == book.id).scalar() or 0))
+
 @app.route('/admin/panel')
 def admin_panel():
-    books = Book.query.order_by(Book.upload_date.desc()).all()
-    total_downloads = Download.query.count()
+    cursor = request.args.get('cursor', '')
+    filters = admin_filters()
+    query, ranked, sort = admin_book_query(filters)
+    books, next_cursor = paginate_books(query, cursor, get_page_size('ADMIN_BOOKS_PER_PAGE'), ranked)
+    total_books = Book.query.count()
+    download_stats = get_download_stats()
+    import_jobs = ImportJob.query.order_by(ImportJob.id.desc()).limit(5).all()
+    maintenance_job = MaintenanceJob.query.order_by(MaintenanceJob.id.desc()).first()
     social_links = SocialLink.query.order_by(SocialLink.order).all()
     donation_links = DonationLink.query.order_by(DonationLink.order).all()
     
@@ -436,10 +2507,106 @@ def admin_panel():
             logo_filename = f'logo.{ext}'
             break
     
-    return render_template('admin.html', books=books, total_downloads=total_downloads,
+    return render_template('admin.html', books=books, total_books=total_books,
+                         next_cursor=next_cursor, is_first_page=not cursor,
+                         filters=filters, sort=sort, sorts=list(ADMIN_SORTS),
+                         total_downloads=download_stats['total_downloads'],
+                         download_stats=download_stats, import_jobs=import_jobs,
+                         maintenance_job=maintenance_job,
                          social_links=social_links, donation_links=donation_links,
                          logo_exists=logo_exists, logo_filename=logo_filename)
 
+# Streaming uploads
+# Werkzeug normally spools every file part of a form to a temporary file,
+# which the view then copies to storage. Book and ZIP parts are instead
+# written straight to their storage's temp area as they arrive, hashed on
+# the way and checked by their leading bytes, so the view only renames them.
+# Leading bytes of each accepted file type, and how far into the file they
+# may start (PDF readers accept a header after some junk)
+FILE_SIGNATURES = {
+    'pdf': (b'%PDF-', 1024),
+    'epub': (b'PK\x03\x04', 0),
+    'zip': (b'PK\x03\x04', 0),
+}
+
+def check_signature(file_type, head, complete=False):
+    """Whether `head`, the first bytes of a file, starts a `file_type`; None while too short to tell"""
+    magic, window = FILE_SIGNATURES[file_type]
+    if head.find(magic, 0, window + len(magic)) != -1:
+        return True
+    if complete or len(head) >= window + len(magic):
+        return False
+    return None
+
+def imports_folder():
+    imports_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'imports')
+    os.makedirs(imports_dir, exist_ok=True)
+    return imports_dir
+
+class IncomingFile:
+    """A file part written to `path` while it is received, hashed and checked by its signature
+
+    Once the first bytes don't match `file_type` the rest is read but
+    dropped, so the view can still answer with an error page. Whatever the
+    view didn't move away is removed when the request ends.
+    """
+
+    def __init__(self, path, file_type):
+        self.path = path
+        self.file_type = file_type
+        self.file = open(path, 'w+b')
+        self.digest = hashlib.sha256()
+        self.head = b''
+        self.valid = None
+
+    @property
+    def rejected(self):
+        return self.valid is False
+
+    def write(self, data):
+        if self.valid is None:
+            self.head += data
+            self.valid = check_signature(self.file_type, self.head)
+        if self.valid is not False:
+            self.digest.update(data)
+            self.file.write(data)
+        return len(data)
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        # Werkzeug rewinds the part once all of it has arrived
+        if self.valid is None:
+            self.valid = check_signature(self.file_type, self.head, complete=True)
+        self.file.flush()
+        return self.file.seek(offset, whence)
+
+    def finish(self):
+        """Mark the file complete, as Werkzeug does by rewinding it; returns whether it was accepted"""
+        self.seek(0)
+        return not self.rejected
+
+    def sha256(self):
+        return self.digest.hexdigest()
+
+    def close(self):
+        self.file.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+class UploadRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        file_type = filename.rsplit('.', 1)[1].lower() if filename and '.' in filename else None
+        if file_type == 'zip':
+            return IncomingFile(os.path.join(imports_folder(), f'{uuid.uuid4().hex}.part'), 'zip')
+        if file_type in FILE_SIGNATURES:
+            return IncomingFile(get_storage().temp_path('books'), file_type)
+        # Covers, OPF files and logos are small; Werkzeug keeps them in memory
+        return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+
+app.request_class = UploadRequest
+
 @app.route('/admin/upload', methods=['POST'])
 def upload_book():
     if 'book_file' not in request.files:
@@ -454,44 +2621,46 @@ def upload_book():
         return redirect(url_for('admin_panel'))
     
     if file and allowed_file(file.filename):
-        filename = secure_filename(file.filename)
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], 'books', filename)
-        file.save(file_path)
+        file_type = file.filename.rsplit('.', 1)[1].lower()
+        if file.stream.rejected:
+            flash(f'"{file.filename}" is not a valid {file_type.upper()} file.', 'error')
+            return redirect(url_for('admin_panel'))
         
-        file_type = filename.rsplit('.', 1)[1].lower()
+        # The upload is on local disk and hashed already: it is checked and
+        # parsed there and only then stored, so remote storage receives it
+        # once and never has to send it back
+        content_hash = file.stream.sha256()
+        existing = find_duplicate_book(content_hash)
+        if existing and app.config['DUPLICATE_UPLOADS'] != 'link':
+            flash(f'"{file.filename}" is already in the library as "{existing.title}"; skipped.', 'error')
+            return redirect(url_for('admin_panel'))
         
         metadata = {}
         
         if opf_file and opf_file.filename.endswith('.opf'):
-            opf_path = os.path.join(app.config['UPLOAD_FOLDER'], 'temp.opf')
-            opf_file.save(opf_path)
-            opf_metadata = extract_metadata_from_opf(opf_path)
-            metadata.update(opf_metadata)
-            os.remove(opf_path)
+            metadata.update(parse_opf_metadata(opf_file.read()))
         
-        if file_type == 'pdf':
-            book_metadata = extract_pdf_metadata(file_path)
-            for key in ['title', 'author', 'description', 'language']:
-                if key not in metadata or not metadata[key]:
-                    if key in book_metadata and book_metadata[key]:
-                        metadata[key] = book_metadata[key]
-        elif file_type == 'epub':
-            book_metadata = extract_epub_metadata(file_path)
-            for key in ['title', 'author', 'description', 'language']:
-                if key not in metadata or not metadata[key]:
-                    if key in book_metadata and book_metadata[key]:
-                        metadata[key] = book_metadata[key]
+        book_metadata = extract_book_metadata(file.stream.path, file_type, content_hash)
+        merge_book_metadata(metadata, book_metadata)
         
-        cover_filename = None
+        if existing:
+            filename = existing.filename
+        else:
+            filename, content_hash = get_storage().put_file('books', file.stream, f'.{file_type}')
+        record_ingest_metrics(file_type, book_metadata['timings'], book_metadata['cached'])
+        log.info('Book parsed', extra={'book_file': filename, 'cached': book_metadata['cached'],
+                                       'timings_ms': timings_ms(book_metadata['timings'])})
+        
+        cover_filename, cover_widths = None, None
         if 'cover_image' in request.files and request.files['cover_image'].filename:
             cover_file = request.files['cover_image']
-            cover_filename = secure_filename(f"cover_{filename.rsplit('.', 1)[0]}.jpg")
-            cover_path = os.path.join(app.config['UPLOAD_FOLDER'], 'covers', cover_filename)
-            cover_file.save(cover_path)
-        elif file_type == 'epub':
-            cover_filename = extract_epub_cover(file_path, f"cover_{filename.rsplit('.', 1)[0]}.jpg")
+            cover_filename, cover_widths = save_cover(cover_file.read(), file.filename)
+        elif existing:
+            cover_filename, cover_widths = existing.cover_image, existing.cover_widths
+        elif book_metadata.get('cover'):
+            cover_filename, cover_widths = save_cover(book_metadata['cover'], file.filename)
         
-        final_title = request.form.get('title', '').strip() or metadata.get('title', '') or filename
+        final_title = request.form.get('title', '').strip() or metadata.get('title', '') or file.filename
         final_author = request.form.get('author', '').strip() or metadata.get('author', '') or 'Unknown'
         final_description = request.form.get('description', '').strip() or metadata.get('description', '') or ''
         final_language = request.form.get('language', '').strip() or metadata.get('language', '') or 'en'
@@ -504,14 +2673,21 @@ def upload_book():
             language=final_language,
             filename=filename,
             cover_image=cover_filename,
+            cover_widths=cover_widths,
             file_type=file_type,
-            subjects=final_subjects
+            content_hash=content_hash
         )
+        set_book_subjects(book, final_subjects)
         
         db.session.add(book)
+        bump_catalogue_version()
         db.session.commit()
         
-        flash(f'Book "{book.title}" uploaded successfully!', 'success')
+        queue_content_indexing()
+        if existing:
+            flash(f'Book "{book.title}" added, sharing the file of identical book "{existing.title}".', 'success')
+        else:
+            flash(f'Book "{book.title}" uploaded successfully!', 'success')
     else:
         flash('Invalid file type. Only PDF and EPUB allowed.', 'error')
     
@@ -525,112 +2701,403 @@ def upload_calibre_zip():
     
     file = request.files['zip_file']
     
-    if file.filename == '' or not file.filename.endswith('.zip'):
+    if file.filename == '' or not file.filename.lower().endswith('.zip') or file.stream.rejected:
         flash('Please upload a valid ZIP file', 'error')
         return redirect(url_for('admin_panel'))
     
-    temp_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'temp_calibre')
-    os.makedirs(temp_dir, exist_ok=True)
-    
-    zip_path = os.path.join(temp_dir, 'calibre_export.zip')
-    file.save(zip_path)
+    # Keep the archive (already on disk next to the others) and hand it to the
+    # import worker; parsing happens in the background so large exports no
+    # longer hit the proxy timeout
+    archive_path = os.path.join(imports_folder(), f'{uuid.uuid4().hex}.zip')
+    file.stream.flush()
+    os.replace(file.stream.path, archive_path)
     
-    books_added = 0
-    books_failed = 0
+    job = ImportJob(filename=secure_filename(file.filename), archive_path=archive_path)
+    db.session.add(job)
+    db.session.commit()
+    import_worker_wakeup.set()
     
+    flash(f'Calibre export "{job.filename}" queued for import (job #{job.id})', 'success')
+    return redirect(url_for('admin_panel'))
+
+# Resumable ZIP uploads
+# The admin panel sends Calibre exports in UPLOAD_CHUNK_BYTES requests to an
+# ImportJob in the 'uploading' state. Each request says with Upload-Offset
+# where its bytes go; the server appends them to <archive>.part only if that
+# is where the file ends, and otherwise answers 409 with what it has, so the
+# browser resends from there after a dropped connection. Bytes received
+# before a connection dropped are kept. The last chunk queues the job.
+def upload_state(job):
+    """What the browser needs to continue a resumable upload"""
+    part_path = job.archive_path + '.part'
+    if job.status == 'uploading':
+        received = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    else:
+        received = job.upload_size if job.status != 'failed' else 0
+    return {'id': job.id, 'status': job.status, 'error': job.error, 'size': job.upload_size,
+            'received': received, 'chunk_size': app.config['UPLOAD_CHUNK_BYTES'],
+            'upload_url': url_for('upload_chunk', job_id=job.id)}
+
+def fail_upload(job, error):
+    job.status = 'failed'
+    job.error = error
+    job.finished_at = datetime.utcnow()
+    db.session.commit()
+    if os.path.exists(job.archive_path + '.part'):
+        os.remove(job.archive_path + '.part')
+
+def expire_abandoned_uploads():
+    idle_since = datetime.utcnow() - timedelta(seconds=app.config['UPLOAD_EXPIRE_SECONDS'])
+    for job in ImportJob.query.filter(ImportJob.status == 'uploading', ImportJob.heartbeat_at < idle_since):
+        fail_upload(job, 'Upload abandoned')
+
+@app.route('/admin/uploads', methods=['POST'])
+def start_upload():
+    """Start a resumable ZIP upload, or find the unfinished one for the same file"""
+    data = request.get_json(silent=True) or {}
+    filename = secure_filename(str(data.get('filename', '')))
+    size = data.get('size')
+    if not filename.lower().endswith('.zip') or not isinstance(size, int) or size <= 0:
+        return jsonify({'error': 'Please upload a valid ZIP file'}), 400
+    if size > app.config['MAX_CONTENT_LENGTH']:
+        return jsonify({'error': 'File too large'}), 413
+    expire_abandoned_uploads()
+    
+    upload_key = str(data.get('key') or '')[:300] or None
+    job = None
+    if upload_key:
+        job = ImportJob.query.filter_by(status='uploading', upload_key=upload_key, upload_size=size) \
+            .order_by(ImportJob.id.desc()).first()
+    if job is None:
+        job = ImportJob(filename=filename, status='uploading', upload_size=size, upload_key=upload_key,
+                        archive_path=os.path.join(imports_folder(), f'{uuid.uuid4().hex}.zip'),
+                        heartbeat_at=datetime.utcnow())
+        db.session.add(job)
+        db.session.commit()
+    return jsonify(upload_state(job))
+
+@app.route('/admin/uploads/<int:job_id>', methods=['PUT'])
+def upload_chunk(job_id):
+    """Append the request body to a resumable upload at its Upload-Offset"""
+    job = ImportJob.query.get_or_404(job_id)
+    if job.status != 'uploading':
+        # Also the answer to a last chunk resent after its response was lost
+        return jsonify(upload_state(job)), 410 if job.status == 'failed' else 200
     try:
-        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            zip_ref.extractall(temp_dir)
-        
-        for root, dirs, files in os.walk(temp_dir):
-            if any(f.endswith(('.pdf', '.epub')) for f in files):
-                book_data = process_calibre_book(root)
-                
-                if book_data:
-                    filename = secure_filename(os.path.basename(book_data['book_file']))
-                    # Make filename unique by adding counter to avoid collisions
-                    import time
-                    unique_id = f"{int(time.time() * 1000000)}"  # Microseconds for uniqueness
-                    base_name = filename.rsplit('.', 1)[0]
-                    extension = filename.rsplit('.', 1)[1]
-                    unique_filename = f"{base_name}_{unique_id}.{extension}"
-                    
-                    dest_path = os.path.join(app.config['UPLOAD_FOLDER'], 'books', unique_filename)
-                    shutil.copy2(book_data['book_file'], dest_path)
-                    
-                    cover_filename = None
-                    # Try to copy cover from Calibre folder first
-                    if book_data['cover_file']:
-                        ext = os.path.splitext(book_data['cover_file'])[1]
-                        cover_unique_id = f"{int(time.time() * 1000000)}"
-                        cover_filename = secure_filename(f"cover_{base_name}_{cover_unique_id}{ext}")
-                        cover_path = os.path.join(app.config['UPLOAD_FOLDER'], 'covers', cover_filename)
-                        try:
-                            shutil.copy2(book_data['cover_file'], cover_path)
-                            print(f"Copied cover: {book_data['cover_file']} -> {cover_path}")
-                            time.sleep(0.001)  # Small delay to ensure unique timestamps
-                        except Exception as e:
-                            print(f"Error copying cover: {e}")
-                            cover_filename = None
-                    
-                    # If no cover from Calibre and it's EPUB, try to extract
-                    if not cover_filename and book_data['file_type'] == 'epub':
-                        cover_filename = extract_epub_cover(dest_path, f"cover_{base_name}_{unique_id}.jpg")
-                    
-                    metadata = book_data['metadata']
-                    
-                    # Get language - CRITICAL FIX
-                    book_language = metadata.get('language')
-                    print(f"Language from metadata: {book_language}")
-                    
-                    if not book_language:
-                        # Try to detect from content as fallback
-                        if book_data['file_type'] == 'pdf':
-                            pdf_meta = extract_pdf_metadata(dest_path)
-                            book_language = pdf_meta.get('language')
-                        elif book_data['file_type'] == 'epub':
-                            epub_meta = extract_epub_metadata(dest_path)
-                            book_language = epub_meta.get('language')
-                    
-                    # Default to 'en' only if absolutely no language found
-                    if not book_language:
-                        book_language = 'en'
-                    
-                    print(f"Creating book: {metadata.get('title', unique_filename)}")
-                    print(f"  Language: {book_language}")
-                    print(f"  Subjects: {metadata.get('subjects', 'None')}")
-                    print(f"  Cover: {cover_filename}")
-                    
-                    book = Book(
-                        title=metadata.get('title', unique_filename),
-                        author=metadata.get('author', 'Unknown'),
-                        description=metadata.get('description', ''),
-                        language=book_language,
-                        filename=unique_filename,
-                        cover_image=cover_filename,
-                        file_type=book_data['file_type'],
-                        subjects=metadata.get('subjects', '')
-                    )
-                    
-                    db.session.add(book)
-                    books_added += 1
-                    
-                    # Small delay between books to ensure unique IDs
-                    time.sleep(0.002)
-    
+        offset = int(request.headers['Upload-Offset'])
+    except (KeyError, ValueError):
+        return jsonify({'error': 'Upload-Offset header required'}), 400
+    
+    part_path = job.archive_path + '.part'
+    with open(part_path, 'ab') as part:
+        try:
+            # A retry may arrive while the request it replaces is still being read
+            fcntl.flock(part, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return jsonify(upload_state(job)), 409
+        received = part.seek(0, os.SEEK_END)
+        if offset != received:
+            return jsonify(upload_state(job)), 409
+        for chunk in iter(lambda: request.stream.read(1024 * 1024), b''):
+            received += len(chunk)
+            if received > job.upload_size:
+                break
+            part.write(chunk)
+    
+    if received > job.upload_size:
+        fail_upload(job, 'More data than announced')
+        return jsonify(upload_state(job)), 413
+    if offset < len(FILE_SIGNATURES['zip'][0]):
+        with open(part_path, 'rb') as part:
+            head = part.read(len(FILE_SIGNATURES['zip'][0]))
+        if check_signature('zip', head, complete=received == job.upload_size) is False:
+            fail_upload(job, 'Not a ZIP file')
+            return jsonify(upload_state(job)), 415
+    
+    job.heartbeat_at = datetime.utcnow()
+    if received == job.upload_size:
+        if not zipfile.is_zipfile(part_path):
+            fail_upload(job, 'Not a readable ZIP file')
+            return jsonify(upload_state(job)), 415
+        os.replace(part_path, job.archive_path)
+        job.status = 'queued'
+        log.info('Upload complete', extra={'job_id': job.id, 'archive': job.filename, 'bytes': received})
+    db.session.commit()
+    if job.status == 'queued':
+        import_worker_wakeup.set()
+    return jsonify(upload_state(job))
+
+# Background import jobs
+# Calibre ZIP exports are imported by a worker thread that claims ImportJob
+# rows and parses book folders in a process pool, reading each member
+# straight from the archive (nothing is extracted to a temp directory). Jobs
+# commit in batches together with their progress counter, so an interrupted
+# job resumes after the last committed batch when the app restarts.
+def group_calibre_members(zip_ref):
+    """Group archive members by Calibre book folder, in a stable order for resuming
+
+    Returns (folder, members) pairs where members names the book, OPF and
+    cover entries of that folder. Only the central directory is read.
+    """
+    folders = {}
+    for info in zip_ref.infolist():
+        if info.is_dir() or info.filename.startswith('__MACOSX/'):
+            continue
+        folder, filename = posixpath.split(info.filename)
+        members = folders.setdefault(folder, {'book': None, 'opf': None, 'cover': None})
+        if filename.endswith('.opf'):
+            members['opf'] = info.filename
+        elif filename.endswith(('.pdf', '.epub')):
+            members['book'] = info.filename
+        elif filename.lower().endswith(('.jpg', '.jpeg', '.png')):
+            # Accept any image file as potential cover
+            if not members['cover'] or 'cover' in filename.lower():
+                members['cover'] = info.filename
+    return [(folder, members) for folder, members in sorted(folders.items()) if members['book']]
+
+# The archive being imported, opened once per pool process by open_import_archive(),
+# the stored books' content hashes (hash -> filename) as of the job's start, and
+# the parent's DUPLICATE_UPLOADS policy
+import_archive = None
+import_known_hashes = {}
+import_link_duplicates = False
+
+def open_import_archive(archive_path, known_hashes, link_duplicates):
+    """Pool initializer: keep the job's archive open for every item this process handles"""
+    global import_archive, import_known_hashes, import_link_duplicates
+    import_archive = zipfile.ZipFile(archive_path, 'r')
+    import_known_hashes = known_hashes
+    import_link_duplicates = link_duplicates
+    # Load the language profiles now rather than in the middle of the first book
+    init_factory()
+
+def prepare_import_item(members):
+    """Stream one Calibre book out of the archive and parse its metadata
+
+    Runs in a worker process, so it must not touch the database. The book is
+    parsed from a local spool before it goes into the blob store, and the OPF
+    is parsed from memory. Returns the Book fields, or None on failure.
+
+    A book whose content hash is already stored is dropped before parsing:
+    only {'content_hash', 'duplicate'} comes back when duplicates are skipped,
+    and the fields point at the stored file when they are linked.
+    """
+    incoming = None
+    try:
+        book_name = posixpath.basename(members['book'])
+        file_type = book_name.rsplit('.', 1)[1].lower()
+        start = time.perf_counter()
+        # Spooled next to the blobs and hashed on the way; parsed from the
+        # spool and only then stored, so remote storage gets each book once
+        incoming = IncomingFile(get_storage().temp_path('books'), file_type)
+        with import_archive.open(members['book']) as src:
+            shutil.copyfileobj(src, incoming, 1024 * 1024)
+        if not incoming.finish():
+            raise ValueError(f'not a valid {file_type.upper()} file')
+        content_hash = incoming.sha256()
+        store_seconds = time.perf_counter() - start
+        
+        duplicate_of = import_known_hashes.get(content_hash)
+        if duplicate_of and not import_link_duplicates:
+            return {'content_hash': content_hash, 'duplicate': True}
+        
+        # Extract metadata from OPF first
+        metadata = {}
+        if members['opf']:
+            metadata = parse_opf_metadata(import_archive.read(members['opf']))
+        
+        # Extract metadata from book if OPF didn't provide it
+        book_metadata = extract_book_metadata(incoming.path, file_type, content_hash)
+        merge_book_metadata(metadata, book_metadata)
+        
+        start = time.perf_counter()
+        if duplicate_of:
+            filename = duplicate_of
+        else:
+            filename, content_hash = get_storage().put_file('books', incoming, f'.{file_type}')
+        store_seconds += time.perf_counter() - start
+        
+        start = time.perf_counter()
+        # Linked duplicates reuse the stored book's cover (filled in by the caller)
+        cover_filename, cover_widths = None, None
+        # Try the cover from the Calibre folder first
+        if members['cover'] and not duplicate_of:
+            cover_filename, cover_widths = save_cover(import_archive.read(members['cover']), book_name)
+        
+        # If no cover from Calibre, use the one embedded in the book
+        if not cover_filename and not duplicate_of and book_metadata.get('cover'):
+            cover_filename, cover_widths = save_cover(book_metadata['cover'], book_name)
+        timings = {'store': store_seconds, **book_metadata['timings'], 'covers': time.perf_counter() - start}
+        log.info('Book parsed', extra={'book_file': book_name, 'cached': book_metadata['cached'],
+                                       'timings_ms': timings_ms(timings)})
+        
+        return {
+            'title': metadata.get('title', book_name),
+            'author': metadata.get('author', 'Unknown'),
+            'description': metadata.get('description', ''),
+            # Default to 'en' only if absolutely no language found
+            'language': metadata.get('language') or 'en',
+            'filename': filename,
+            'cover_image': cover_filename,
+            'cover_widths': cover_widths,
+            'file_type': file_type,
+            'subjects': metadata.get('subjects', ''),
+            'content_hash': content_hash,
+            'duplicate': bool(duplicate_of),
+            # Recorded by the parent: metrics live in the web process, not in pool workers
+            'timings': timings,
+            'cached': book_metadata['cached'],
+        }
     except Exception as e:
-        print(f"Error processing ZIP: {e}")
-        flash(f'Error processing ZIP file: {str(e)}', 'error')
+        log.warning('Cannot import book', extra={'member': members['book'], 'error': str(e)})
+        return None
     finally:
-        shutil.rmtree(temp_dir, ignore_errors=True)
-    
-    if books_added > 0:
+        if incoming is not None:
+            incoming.close()
+
+import_worker_wakeup = threading.Event()
+import_worker_thread = None
+
+def claim_job(model):
+    """Atomically take the oldest queued (or abandoned running) ImportJob or MaintenanceJob"""
+    stale_before = datetime.utcnow() - timedelta(seconds=app.config['IMPORT_STALE_SECONDS'])
+    claimable = db.or_(
+        model.status == 'queued',
+        db.and_(model.status == 'running',
+                db.or_(model.heartbeat_at.is_(None), model.heartbeat_at < stale_before))
+    )
+    for job in model.query.filter(claimable).order_by(model.id).all():
+        now = datetime.utcnow()
+        # Conditional UPDATE so two workers can never claim the same job
+        claimed = model.query.filter(model.id == job.id, claimable).update(
+            {'status': 'running', 'heartbeat_at': now,
+             'started_at': db.func.coalesce(model.started_at, now)},
+            synchronize_session=False)
         db.session.commit()
-        flash(f'Successfully added {books_added} books from Calibre export!', 'success')
-    else:
-        flash('No valid books found in the ZIP file', 'error')
+        if claimed:
+            return db.session.get(model, job.id)
+    return None
+
+def run_import_job(job):
+    """Import a job's books straight from its archive, resuming at job.processed"""
+    with zipfile.ZipFile(job.archive_path, 'r') as zip_ref:
+        groups = group_calibre_members(zip_ref)
+    job.total = len(groups)
+    job.heartbeat_at = datetime.utcnow()
+    db.session.commit()
     
-    return redirect(url_for('admin_panel'))
+    batch_size = app.config['IMPORT_BATCH_SIZE']
+    pending = 0
+    context = multiprocessing.get_context('spawn')
+    known_hashes = {}
+    for content_hash, filename in db.session.query(Book.content_hash, Book.filename) \
+            .filter(Book.content_hash.isnot(None)):
+        # Prefer the content-addressed key over an unmigrated flat name
+        if content_hash not in known_hashes or SHARDED_KEY_RE.match(filename):
+            known_hashes[content_hash] = filename
+    with ProcessPoolExecutor(max_workers=app.config['IMPORT_PROCESSES'], mp_context=context,
+                             initializer=open_import_archive,
+                             initargs=(job.archive_path, known_hashes,
+                                       app.config['DUPLICATE_UPLOADS'] == 'link')) as pool:
+        # map() yields results in folder order, so `processed` is a valid resume point
+        members = [members for folder, members in groups[job.processed:]]
+        for fields in pool.map(prepare_import_item, members, chunksize=4):
+            if not fields:
+                job.books_failed += 1
+            elif 'filename' not in fields:
+                # Skipped by the worker as identical to a stored book
+                job.books_duplicate = (job.books_duplicate or 0) + 1
+            else:
+                record_ingest_metrics(fields['file_type'], fields.pop('timings'), fields.pop('cached'))
+                existing = find_duplicate_book(fields['content_hash'])
+                if existing and not fields.pop('duplicate'):
+                    # Identical to a book added after the job started (e.g. earlier in this archive)
+                    discard_book_files(fields['filename'], fields['cover_image'], fields['cover_widths'])
+                if existing and app.config['DUPLICATE_UPLOADS'] != 'link':
+                    job.books_duplicate = (job.books_duplicate or 0) + 1
+                else:
+                    if existing:
+                        fields.update(filename=existing.filename, cover_image=existing.cover_image,
+                                      cover_widths=existing.cover_widths)
+                    fields.pop('duplicate', None)
+                    subjects = fields.pop('subjects')
+                    book = Book(**fields)
+                    set_book_subjects(book, subjects)
+                    db.session.add(book)
+                    job.books_added += 1
+            job.processed += 1
+            pending += 1
+            
+            if pending >= batch_size:
+                job.heartbeat_at = datetime.utcnow()
+                bump_catalogue_version()
+                db.session.commit()
+                pending = 0
+    
+    job.status = 'done'
+    job.finished_at = datetime.utcnow()
+    bump_catalogue_version()
+    db.session.commit()
+    queue_content_indexing()
+    
+    if os.path.exists(job.archive_path):
+        os.remove(job.archive_path)
+
+def import_worker_loop():
+    """Run import and maintenance jobs one at a time for the life of the process"""
+    with app.app_context():
+        while True:
+            job = None
+            try:
+                job = claim_job(ImportJob) or claim_job(MaintenanceJob)
+                if job is None:
+                    # Also poll now and then: jobs may be queued by another process
+                    import_worker_wakeup.wait(timeout=10)
+                    import_worker_wakeup.clear()
+                    continue
+                if isinstance(job, MaintenanceJob):
+                    log.info('Maintenance job started', extra={'job_id': job.id, 'task': job.task,
+                                                               'after_book': job.last_id})
+                    run_maintenance_job(job)
+                    log.info('Maintenance job done', extra={'job_id': job.id, 'task': job.task,
+                                                            'changed': job.changed, 'skipped': job.skipped})
+                    continue
+                log.info('Import job started', extra={'job_id': job.id, 'archive': job.filename,
+                                                      'at_book': job.processed})
+                run_import_job(job)
+                log.info('Import job done', extra={'job_id': job.id, 'added': job.books_added,
+                                                   'failed': job.books_failed,
+                                                   'duplicates': job.books_duplicate or 0})
+            except Exception as e:
+                log.exception('Background job failed', extra={'job_id': job.id if job else None})
+                db.session.rollback()
+                if job is not None:
+                    job.status = 'failed'
+                    job.error = str(e)
+                    job.finished_at = datetime.utcnow()
+                    db.session.commit()
+            finally:
+                db.session.remove()
+                metrics.flush()
+
+def start_import_worker():
+    """Start the background import and maintenance thread once per process"""
+    global import_worker_thread
+    if import_worker_thread is None or not import_worker_thread.is_alive():
+        import_worker_thread = threading.Thread(target=import_worker_loop, name='import-worker', daemon=True)
+        import_worker_thread.start()
+
+@app.route('/admin/import-jobs')
+def import_jobs_status():
+    """Recent import jobs as JSON, newest first"""
+    jobs = ImportJob.query.order_by(ImportJob.id.desc()).limit(20).all()
+    return jsonify({'jobs': [job.to_dict() for job in jobs]})
+
+@app.route('/admin/import-jobs/<int:job_id>')
+def import_job_status(job_id):
+    """Progress of one import job, polled by the admin panel"""
+    job = ImportJob.query.get_or_404(job_id)
+    return jsonify(job.to_dict())
 
 @app.route('/admin/edit/<int:book_id>', methods=['POST'])
 def edit_book(book_id):
@@ -650,7 +3117,8 @@ def edit_book(book_id):
     book.author = author if author else 'Unknown'
     book.description = description
     book.language = language if language else 'en'
-    book.subjects = subjects
+    set_book_subjects(book, subjects)
+    bump_catalogue_version()
     
     db.session.commit()
     flash(f'Book "{book.title}" updated successfully!', 'success')
@@ -661,23 +3129,219 @@ def edit_book(book_id):
 def delete_book(book_id):
     book = Book.query.get_or_404(book_id)
     
-    book_path = os.path.join(app.config['UPLOAD_FOLDER'], 'books', book.filename)
-    if os.path.exists(book_path):
-        os.remove(book_path)
+    # Linked duplicates share the file; keep it while one of them remains
+    if not Book.query.filter(Book.filename == book.filename, Book.id != book.id).first():
+        get_storage().delete('books', book.filename)
     
-    if book.cover_image:
-        cover_path = os.path.join(app.config['UPLOAD_FOLDER'], 'covers', book.cover_image)
-        if os.path.exists(cover_path):
-            os.remove(cover_path)
+    delete_cover_files(book)
     
     Download.query.filter_by(book_id=book_id).delete()
+    DailyDownloads.query.filter_by(book_id=book_id).delete()
     
     db.session.delete(book)
+    bump_catalogue_version()
     db.session.commit()
     
     flash(f'Book "{book.title}" deleted successfully!', 'success')
     return redirect(url_for('admin_panel'))
 
+# Bulk book operations
+BULK_EDIT_FIELDS = ('author', 'language')
+BULK_CHUNK_SIZE = 500  # IDs per IN (...) clause, well under SQLite's variable limit
+
+def chunked(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def resolve_bulk_ids(payload):
+    """Book IDs named by an explicit `ids` list or by a catalogue `filter`"""
+    if payload.get('ids') is not None:
+        ids = {int(book_id) for book_id in payload['ids']}
+        return sorted(book_id for (book_id,) in
+                      db.session.query(Book.id).filter(Book.id.in_(ids)))
+    criteria = payload.get('filter') or {}
+    if not any(criteria.get(key) for key in ('search', 'language', 'subject')):
+        raise ValueError('Give a list of ids or a non-empty filter')
+    query, ranked = filter_books(criteria.get('search', ''), criteria.get('language', ''),
+                                 criteria.get('subject', ''))
+    return sorted({book_id for (book_id,) in query.with_entities(Book.id)})
+
+def bulk_edit_fields(payload):
+    """The BULK_EDIT_FIELDS to set, trimmed; ValueError when one is malformed"""
+    fields = {}
+    for key in BULK_EDIT_FIELDS:
+        value = payload.get(key)
+        if value is None:
+            continue
+        if not isinstance(value, str):
+            raise ValueError(f'{key} must be a string')
+        if value.strip():
+            fields[key] = value.strip()
+    if 'language' in fields and fields['language'] not in SUPPORTED_LANGUAGES:
+        raise ValueError(f"Unsupported language: {fields['language']}")
+    return fields
+
+def bulk_subject_names(value):
+    """Unique, trimmed subject names from a comma-separated string or a list of strings"""
+    if not value:
+        return []
+    if isinstance(value, str):
+        return split_subjects(value)
+    if not isinstance(value, list) or not all(isinstance(name, str) for name in value):
+        raise ValueError('subjects_add and subjects_remove must be a string or a list of strings')
+    # Stored subjects are comma-separated, so a comma inside a name splits it here too
+    return split_subjects(', '.join(value))
+
+def bulk_update_books(ids, fields, subjects_add, subjects_remove):
+    """Apply field and subject changes to many books with set-based SQL; returns counts"""
+    result = {'updated': 0, 'subjects_added': 0, 'subjects_removed': 0}
+    if fields:
+        for chunk in chunked(ids, BULK_CHUNK_SIZE):
+            result['updated'] += db.session.execute(
+                db.update(Book).where(Book.id.in_(chunk)).values(**fields)
+                .execution_options(synchronize_session=False)).rowcount
+    if not subjects_add and not subjects_remove:
+        return result
+
+    added_subjects = get_or_create_subjects(subjects_add)
+    db.session.flush()
+    add_ids = [subject.id for subject in added_subjects]
+    remove_ids = [subject_id for (subject_id,) in
+                  db.session.query(Subject.id).filter(Subject.name.in_(subjects_remove))]
+    for chunk in chunked(ids, BULK_CHUNK_SIZE):
+        if remove_ids:
+            result['subjects_removed'] += db.session.execute(
+                book_subject.delete().where(book_subject.c.book_id.in_(chunk),
+                                            book_subject.c.subject_id.in_(remove_ids))).rowcount
+        for subject_id in add_ids:
+            result['subjects_added'] += db.session.execute(
+                sqlite_insert(book_subject).prefix_with('OR IGNORE').from_select(
+                    ['book_id', 'subject_id'],
+                    db.select(Book.id, db.literal(subject_id)).where(Book.id.in_(chunk)))).rowcount
+
+    # Rewrite the denormalized subjects strings, keeping each book's existing order
+    removed = set(subjects_remove)
+    rows = []
+    for chunk in chunked(ids, BULK_CHUNK_SIZE):
+        for book_id, subjects in db.session.query(Book.id, Book.subjects).filter(Book.id.in_(chunk)):
+            names = [name for name in split_subjects(subjects) if name not in removed]
+            names += [name for name in subjects_add if name not in names]
+            new_subjects = ', '.join(names)
+            if new_subjects != (subjects or ''):
+                rows.append({'book_id': book_id, 'subjects': new_subjects})
+    if rows:
+        db.session.execute(
+            db.update(Book.__table__).where(Book.id == db.bindparam('book_id'))
+            .values(subjects=db.bindparam('subjects')), rows)
+    if not fields:
+        result['updated'] = len(rows)
+    return result
+
+def bulk_delete_books(ids):
+    """Delete many books and their rows in bulk; returns the (kind, key) blobs left to remove"""
+    book_files, cover_files = {}, {}
+    deleted = 0
+    for chunk in chunked(ids, BULK_CHUNK_SIZE):
+        for book in Book.query.filter(Book.id.in_(chunk)):
+            book_files[book.filename] = [('books', book.filename)]
+            if book.cover_image:
+                cover_files[book.cover_image] = [('covers', filename)
+                                                 for width, filename in cover_variants(book)]
+        db.session.execute(book_subject.delete().where(book_subject.c.book_id.in_(chunk)))
+        for model in (Download, DailyDownloads):
+            db.session.execute(db.delete(model).where(model.book_id.in_(chunk))
+                               .execution_options(synchronize_session=False))
+        deleted += db.session.execute(db.delete(Book).where(Book.id.in_(chunk))
+                                      .execution_options(synchronize_session=False)).rowcount
+    
+    # Keep files that linked duplicates outside the selection still use
+    for column, files in ((Book.filename, book_files), (Book.cover_image, cover_files)):
+        for chunk in chunked(list(files), BULK_CHUNK_SIZE):
+            for (name,) in db.session.query(column).filter(column.in_(chunk)).distinct():
+                files.pop(name, None)
+    blobs = []
+    for files in (book_files, cover_files):
+        for variants in files.values():
+            blobs.extend(variants)
+    return deleted, blobs
+
+def unlink_files(blobs):
+    """Remove deleted books' files; runs after the commit, off the request thread"""
+    failed = 0
+    for kind, key in blobs:
+        try:
+            get_storage().delete(kind, key)
+        except OSError as e:
+            log.warning('Cannot remove file', extra={'kind': kind, 'key': key, 'error': str(e)})
+            failed += 1
+    log.info('Removed files of deleted books', extra={'removed': len(blobs) - failed, 'failed': failed})
+
+@app.route('/admin/books/bulk', methods=['POST'])
+def bulk_books():
+    """Batch edit, re-language, re-subject or delete books in one transaction
+
+    Accepts JSON (or the admin panel form) with either `ids` or a `filter`
+    ({search, language, subject}) and an `action` of 'update' or 'delete'.
+    Updates take any of `author`, `language` (one of SUPPORTED_LANGUAGES),
+    `subjects_add` and `subjects_remove` (comma-separated strings or lists of
+    names). Malformed input gets a 400.
+    """
+    start = time.perf_counter()
+    if request.is_json:
+        payload = request.get_json(silent=True) or {}
+    else:
+        payload = {key: request.form.get(key, '').strip() for key in
+                   ('action', 'subjects_add', 'subjects_remove') + BULK_EDIT_FIELDS}
+        payload['ids'] = request.form.getlist('ids')
+
+    action = payload.get('action')
+    fields, subjects_add, subjects_remove = {}, [], []
+
+    error = None
+    ids = []
+    if action not in ('update', 'delete'):
+        error = "action must be 'update' or 'delete'"
+    else:
+        try:
+            if action == 'update':
+                fields = bulk_edit_fields(payload)
+                subjects_add = bulk_subject_names(payload.get('subjects_add'))
+                subjects_remove = bulk_subject_names(payload.get('subjects_remove'))
+                if not (fields or subjects_add or subjects_remove):
+                    raise ValueError('Nothing to update')
+            ids = resolve_bulk_ids(payload)
+        except (TypeError, ValueError) as e:
+            error = str(e) or 'Invalid book ids'
+    if error:
+        if request.is_json:
+            return jsonify({'error': error}), 400
+        flash(error, 'error')
+        return redirect(url_for('admin_panel'))
+
+    result = {'action': action, 'matched': len(ids)}
+    blobs = []
+    if ids and action == 'update':
+        result.update(bulk_update_books(ids, fields, subjects_add, subjects_remove))
+    elif ids:
+        result['deleted'], blobs = bulk_delete_books(ids)
+        result['files_queued'] = len(blobs)
+    if ids:
+        bump_catalogue_version()
+    db.session.commit()
+
+    if blobs:
+        threading.Thread(target=unlink_files, args=(blobs,), name='unlink-files', daemon=True).start()
+    result['elapsed_ms'] = round((time.perf_counter() - start) * 1000, 1)
+    log.info('Bulk book operation', extra={'action': action, 'result': result})
+
+    if request.is_json:
+        return jsonify(result)
+    if action == 'delete':
+        flash(f"Deleted {result.get('deleted', 0)} books in {result['elapsed_ms']}ms", 'success')
+    else:
+        flash(f"Updated {result.get('updated', 0)} of {len(ids)} books in {result['elapsed_ms']}ms", 'success')
+    return redirect(url_for('admin_panel'))
+
 # Social Links Management
 @app.route('/admin/social/add', methods=['POST'])
 def add_social_link():
@@ -689,6 +3353,7 @@ def add_social_link():
         max_order = db.session.query(db.func.max(SocialLink.order)).scalar() or 0
         social = SocialLink(platform=platform, url=url, description=description, order=max_order + 1)
         db.session.add(social)
+        bump_catalogue_version()
         db.session.commit()
         flash(f'Social link "{platform}" added!', 'success')
     else:
@@ -700,6 +3365,7 @@ def add_social_link():
 def delete_social_link(link_id):
     link = SocialLink.query.get_or_404(link_id)
     db.session.delete(link)
+    bump_catalogue_version()
     db.session.commit()
     flash('Social link deleted!', 'success')
     return redirect(url_for('admin_panel'))
@@ -715,6 +3381,7 @@ def add_donation_link():
         max_order = db.session.query(db.func.max(DonationLink.order)).scalar() or 0
         donation = DonationLink(platform=platform, url=url, description=description, order=max_order + 1)
         db.session.add(donation)
+        bump_catalogue_version()
         db.session.commit()
         flash(f'Donation link "{platform}" added!', 'success')
     else:
@@ -726,54 +3393,444 @@ def add_donation_link():
 def delete_donation_link(link_id):
     link = DonationLink.query.get_or_404(link_id)
     db.session.delete(link)
+    bump_catalogue_version()
     db.session.commit()
     flash('Donation link deleted!', 'success')
     return redirect(url_for('admin_panel'))
 
-# Utility route to clean existing descriptions
+# Library maintenance jobs
+# A task visits every book in id order, a chunk of rows at a time
+# (MAINTENANCE_CHUNK_SIZE unless the task names its own setting), and returns
+# the column updates for each chunk. The runner commits each chunk together
+# with the job's last_id, so an interrupted job resumes after the last
+# committed book. Tasks with slow per-row work call heartbeat() as they go,
+# so the job isn't taken for abandoned (IMPORT_STALE_SECONDS) and claimed a
+# second time while a chunk is still running. Tasks that fan out to worker
+# processes share one pool for the whole job: a spawn pool re-imports the app
+# in every child, which takes over a second.
+MAINTENANCE_TASKS = {}
+
+def maintenance_task(name, *columns, chunk_size='MAINTENANCE_CHUNK_SIZE', pending=None, pool=False):
+    """Register func(rows, heartbeat) -> (updates, changed); rows are (id, *columns) tuples
+
+    chunk_size is the config key of the task's rows per chunk. pending, a
+    filter on Book, limits the job to the books that need work, so a job
+    queued for one new book doesn't walk the whole table. With pool=True the
+    task is called as func(rows, heartbeat, get_pool), where get_pool()
+    starts the job's process pool on first use.
+    """
+    def register(func):
+        MAINTENANCE_TASKS[name] = (columns, func, chunk_size, pending, pool)
+        return func
+    return register
+
+def description_hash(text):
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=8).hexdigest()
+
+@maintenance_task('clean-descriptions', Book.description, Book.description_hash)
+def clean_description_rows(rows, heartbeat):
+    """Strip HTML from descriptions not yet marked clean by their stored hash"""
+    updates = []
+    changed = 0
+    for book_id, description, stored_hash in rows:
+        if not description or stored_hash == description_hash(description):
+            continue
+        clean = strip_html_tags(description)
+        if clean == description:
+            # Only mark it clean: rewriting the text would fire the FTS update trigger for nothing
+            updates.append({'book_id': book_id, 'description_hash': description_hash(clean)})
+            continue
+        changed += 1
+        updates.append({'book_id': book_id, 'description': clean,
+                        'description_hash': description_hash(clean)})
+    return updates, changed
+
+def queue_maintenance_job(task):
+    """Queue a task, or return its unfinished job (a failed one resumes where it stopped)"""
+    job = MaintenanceJob.query.filter(MaintenanceJob.task == task,
+                                      MaintenanceJob.status.in_(['queued', 'running', 'failed'])) \
+        .order_by(MaintenanceJob.id.desc()).first()
+    if job is None:
+        job = MaintenanceJob(task=task)
+        db.session.add(job)
+    elif job.status == 'failed':
+        job.status, job.error, job.finished_at = 'queued', None, None
+    db.session.commit()
+    return job
+
+def run_maintenance_job(job):
+    """Run a job's task over the (pending) books after job.last_id, committing every chunk"""
+    columns, process, chunk_size, pending, uses_pool = MAINTENANCE_TASKS[job.task]
+    chunk_size = app.config[chunk_size]
+    filters = [pending] if pending is not None else []
+    if not job.processed:
+        job.total = Book.query.filter(*filters).count()
+    
+    def heartbeat():
+        """Mark the job alive; commits whatever the task has written so far"""
+        job.heartbeat_at = datetime.utcnow()
+        db.session.commit()
+    
+    with ExitStack() as stack:
+        pool = None
+        
+        def get_pool():
+            """The job's worker pool, started on first use and kept for all its chunks"""
+            nonlocal pool
+            if pool is None:
+                context = multiprocessing.get_context('spawn')
+                pool = stack.enter_context(context.Pool(app.config['IMPORT_PROCESSES']))
+            return pool
+        
+        while True:
+            rows = db.session.query(Book.id, *columns).filter(Book.id > job.last_id, *filters) \
+                .order_by(Book.id).limit(chunk_size).all()
+            if not rows:
+                break
+            updates, changed = process(rows, heartbeat, get_pool) if uses_pool else process(rows, heartbeat)
+            # One executemany per set of columns, as rows of a chunk may update different ones
+            by_columns = {}
+            for update in updates:
+                by_columns.setdefault(tuple(update), []).append(update)
+            for keys, group in by_columns.items():
+                values = {key: db.bindparam(key) for key in keys if key != 'book_id'}
+                db.session.execute(db.update(Book.__table__).where(Book.id == db.bindparam('book_id'))
+                                   .values(values), group)
+            if changed:
+                bump_catalogue_version()
+            job.last_id = rows[-1][0]
+            job.processed += len(rows)
+            # Books added since the job started are visited too
+            job.total = max(job.total or 0, job.processed)
+            job.changed += changed
+            job.skipped += len(rows) - len(updates)
+            job.heartbeat_at = datetime.utcnow()
+            db.session.commit()
+    
+    job.status = 'done'
+    job.finished_at = datetime.utcnow()
+    db.session.commit()
+
 @app.route('/admin/clean-descriptions', methods=['POST'])
 def clean_descriptions():
-    """Strip HTML from all existing book descriptions"""
-    books = Book.query.all()
-    count = 0
+    """Queue HTML stripping of all book descriptions as a background job"""
+    job = queue_maintenance_job('clean-descriptions')
+    import_worker_wakeup.set()
+    flash(f'Description cleaning queued as job #{job.id}; it runs in the background.', 'success')
+    return redirect(url_for('admin_panel'))
+
+@app.route('/admin/maintenance-jobs/<int:job_id>')
+def maintenance_job_status(job_id):
+    """Progress of one maintenance job"""
+    job = MaintenanceJob.query.get_or_404(job_id)
+    return jsonify(job.to_dict())
+
+@app.cli.command('run-maintenance')
+@click.argument('task')
+def run_maintenance_command(task):
+    """Run (or resume) a library maintenance task in this process."""
+    # Checked here, not with click.Choice: tasks further down the module register later
+    if task not in MAINTENANCE_TASKS:
+        raise click.BadParameter(f"choose from {', '.join(sorted(MAINTENANCE_TASKS))}", param_hint='TASK')
+    init_db()
+    job = queue_maintenance_job(task)
+    job.status = 'running'
+    job.started_at = job.started_at or datetime.utcnow()
+    db.session.commit()
+    run_maintenance_job(job)
+    print(f'{task}: {job.processed} books, {job.changed} changed, {job.skipped} skipped')
+
+# Duplicate books
+# Books are identified by the SHA-256 of their file. Uploads and imports
+# check it before parsing; books stored before the hash existed get it from
+# the hash-books maintenance task.
+def find_duplicate_book(content_hash):
+    """The oldest stored book with this content hash, if any"""
+    return Book.query.filter_by(content_hash=content_hash).order_by(Book.id).first()
+
+def discard_book_files(filename, cover_image, cover_widths):
+    """Remove a book file and cover derivatives that no Book row refers to"""
+    if not Book.query.filter_by(filename=filename).first():
+        get_storage().delete('books', filename)
+    if cover_image:
+        delete_cover_files(Book(cover_image=cover_image, cover_widths=cover_widths))
+
+@maintenance_task('hash-books', Book.filename, Book.content_hash)
+def hash_book_rows(rows, heartbeat):
+    """Record the content hash of books stored before hashing was added"""
+    updates = []
+    for book_id, filename, content_hash in rows:
+        if content_hash or not get_storage().exists('books', filename):
+            continue
+        if SHARDED_KEY_RE.match(filename):
+            # Content-addressed keys are the hash
+            content_hash = posixpath.basename(filename).split('.', 1)[0]
+        else:
+            with get_storage().local_file('books', filename) as file_path:
+                content_hash = file_sha256(file_path)
+            # Reading a whole file (from S3, a download) can take a while
+            heartbeat()
+        updates.append({'book_id': book_id, 'content_hash': content_hash})
+    # Hashes don't show in the catalogue, so nothing counts as changed
+    return updates, 0
+
+def find_duplicate_groups():
+    """Groups of books sharing a content hash, with the space their extra copies take"""
+    duplicate_hashes = db.session.query(Book.content_hash) \
+        .filter(Book.content_hash.isnot(None)) \
+        .group_by(Book.content_hash) \
+        .having(db.func.count(Book.id) > 1)
+    books = Book.query.filter(Book.content_hash.in_(duplicate_hashes)) \
+        .order_by(Book.content_hash, Book.id).all()
+    
+    groups = []
     for book in books:
-        if book.description:
-            old_desc = book.description
-            # Strip HTML
-            clean_desc = unescape(old_desc)
-            clean = re.compile('<.*?>')
-            clean_desc = re.sub(clean, '', clean_desc)
-            clean_desc = ' '.join(clean_desc.split())
-            
-            if clean_desc != old_desc:
-                book.description = clean_desc
-                count += 1
-    
+        if not groups or groups[-1]['content_hash'] != book.content_hash:
+            groups.append({'content_hash': book.content_hash, 'books': [], 'files': [], 'wasted_bytes': 0})
+        group = groups[-1]
+        group['books'].append({'id': book.id, 'title': book.title, 'filename': book.filename})
+        if book.filename not in group['files']:
+            # Every stored copy after the first is wasted space
+            if group['files'] and get_storage().exists('books', book.filename):
+                group['wasted_bytes'] += get_storage().size('books', book.filename)
+            group['files'].append(book.filename)
+    return groups
+
+@app.route('/admin/duplicates')
+def duplicates_report():
+    """Duplicate books as JSON"""
+    groups = find_duplicate_groups()
+    unhashed = Book.query.filter(Book.content_hash.is_(None)).count()
+    return jsonify({'groups': groups, 'unhashed_books': unhashed,
+                    'wasted_bytes': sum(group['wasted_bytes'] for group in groups)})
+
+@app.cli.command('report-duplicates')
+def report_duplicates_command():
+    """List books whose files are identical."""
+    init_db()
+    groups = find_duplicate_groups()
+    for group in groups:
+        print(f"{group['content_hash'][:12]}  {len(group['books'])} books, {len(group['files'])} files, "
+              f"{group['wasted_bytes'] / 1024 / 1024:.1f} MiB wasted")
+        for book in group['books']:
+            print(f"    #{book['id']} {book['title']} ({book['filename']})")
+    wasted = sum(group['wasted_bytes'] for group in groups)
+    print(f'{len(groups)} duplicate groups, {wasted / 1024 / 1024:.1f} MiB reclaimable')
+    unhashed = Book.query.filter(Book.content_hash.is_(None)).count()
+    if unhashed:
+        print(f'{unhashed} books have no content hash yet; run "flask run-maintenance hash-books" first')
+
+@app.cli.command('reclaim-duplicates')
+@click.option('--dry-run', is_flag=True, help='Only report what would be removed.')
+def reclaim_duplicates_command(dry_run):
+    """Point duplicate books at one shared file and delete the extra copies."""
+    init_db()
+    store = get_storage()
+    freed = removed = skipped = 0
+    for group in find_duplicate_groups():
+        # Only a file that is really there can be kept; a record may point at a lost one
+        stored = [f for f in group['files'] if store.exists('books', f)]
+        if not stored:
+            print(f"{group['content_hash'][:12]}: none of {', '.join(group['files'])} exists; skipped")
+            skipped += 1
+            continue
+        # Keep the content-addressed copy when there is one
+        keep = next((f for f in stored if SHARDED_KEY_RE.match(f)), stored[0])
+        extra_files = [f for f in group['files'] if f != keep]
+        if not extra_files:
+            continue
+        freed += sum(store.size('books', f) for f in stored if f != keep)
+        removed += len(extra_files)
+        if dry_run:
+            continue
+        # Repoint the records first, so no book is ever left without a file
+        Book.query.filter(Book.filename.in_(extra_files)).update(
+            {'filename': keep}, synchronize_session=False)
+        db.session.commit()
+        for filename in extra_files:
+            store.delete('books', filename)
+    action = 'Would remove' if dry_run else 'Removed'
+    print(f'{action} {removed} duplicate files, {freed / 1024 / 1024:.1f} MiB')
+    if skipped:
+        print(f'{skipped} duplicate groups have no stored file left and were skipped')
+
+# In-book search
+# The index-contents task extracts the text of new or changed books in a
+# worker pool and stores it as BookContent pieces, which book_content_fts
+# indexes. It is queued after uploads and imports, and only visits books whose
+# indexed text is missing or stale. Each book's text is
+# committed as soon as it arrives, so only a few books are held in memory and
+# the job's heartbeat stays fresh however long a chunk takes.
+@maintenance_task('index-contents', Book.filename, Book.file_type, Book.content_hash, Book.content_indexed_hash,
+                  chunk_size='CONTENT_INDEX_CHUNK_SIZE', pool=True,
+                  pending=db.and_(Book.content_hash.isnot(None),
+                                  db.or_(Book.content_indexed_hash.is_(None),
+                                         Book.content_indexed_hash != Book.content_hash)))
+def index_content_rows(rows, heartbeat, get_pool):
+    """Index the text of books whose file changed since it was last indexed"""
+    if not app.config.get('FTS_ENABLED'):
+        return [], 0
+    # Unhashed books wait for the hash-books task and are picked up by a later run
+    todo = [(book_id, filename, file_type) for book_id, filename, file_type, content_hash, indexed_hash in rows
+            if content_hash and content_hash != indexed_hash]
+    if not todo:
+        return [], 0
+    content_hashes = {row[0]: row[3] for row in rows}
+
+    updates = []
+    def store(book_id, chunks):
+        # Replacing a book's pieces is idempotent, so a chunk cut short is simply redone
+        db.session.execute(db.delete(BookContent).where(BookContent.book_id == book_id))
+        if chunks:
+            db.session.execute(db.insert(BookContent), [
+                {'book_id': book_id, 'position': position, 'location': location, 'text': text}
+                for position, (location, text) in enumerate(chunks)])
+        heartbeat()
+        updates.append({'book_id': book_id, 'content_indexed_hash': content_hashes[book_id]})
+
+    if len(todo) == 1:
+        # A lone new book isn't worth starting the pool for
+        store(*extract_book_text(todo[0]))
+    else:
+        # imap() hands back each book's text in order as it is ready
+        for book_id, chunks in get_pool().imap(extract_book_text, todo):
+            store(book_id, chunks)
+    return updates, len(updates)
+
+def queue_content_indexing():
+    """Index new books' text in the background"""
+    if app.config.get('FTS_ENABLED'):
+        queue_maintenance_job('index-contents')
+        import_worker_wakeup.set()
+
+def highlight_snippet(snippet):
+    """Escape a snippet() result and turn its \x02/\x03 match markers into <mark>"""
+    return Markup(str(escape(snippet)).replace('\x02', '<mark>').replace('\x03', '</mark>'))
+
+def search_book_contents(search_query, language_filter='', snippets_per_book=3):
+    """Books whose text matches, best first, each with its matching locations and snippets"""
+    fts_query = build_fts_query(search_query)
+    if fts_query is None or not app.config.get('FTS_ENABLED'):
+        return []
+    sql = (
+        "SELECT c.book_id, c.location, "
+        "snippet(book_content_fts, 0, char(2), char(3), '…', 24) AS snippet "
+        "FROM book_content_fts JOIN book_content c ON c.id = book_content_fts.rowid "
+        "JOIN book b ON b.id = c.book_id "
+        "WHERE book_content_fts MATCH :fts_query "
+    )
+    params = {'fts_query': fts_query, 'limit': app.config['CONTENT_SEARCH_LIMIT']}
+    if language_filter:
+        sql += "AND b.language = :language "
+        params['language'] = language_filter
+    sql += "ORDER BY bm25(book_content_fts) LIMIT :limit"
+
+    hits = {}
+    for book_id, location, snippet in db.session.execute(db.text(sql), params):
+        book_hits = hits.setdefault(book_id, [])
+        if len(book_hits) < snippets_per_book:
+            book_hits.append({'location': location, 'snippet': highlight_snippet(snippet)})
+    books = {book.id: book for book in Book.query.filter(Book.id.in_(list(hits)))}
+    # Dicts keep insertion order, so books come out in the order of their best hit
+    return [{'book': books[book_id], 'hits': book_hits} for book_id, book_hits in hits.items() if book_id in books]
+
+@app.route('/search-inside')
+@cached_page
+def search_inside():
+    """Search the text of the books, with highlighted snippets"""
+    search_query = request.args.get('search', '').strip()
+    language_filter = request.args.get('language', '')
+    results = search_book_contents(search_query, language_filter) if search_query else []
+
+    languages = [lang for (lang,) in db.session.query(Book.language).distinct() if lang]
+    social_links = SocialLink.query.order_by(SocialLink.order).all()
+    donation_links = DonationLink.query.order_by(DonationLink.order).all()
+
+    return render_template('search_inside.html', results=results, search_query=search_query,
+                         languages=languages, selected_language=language_filter,
+                         social_links=social_links, donation_links=donation_links)
+
+@app.cli.command('rebuild-content-index')
+def rebuild_content_index_command():
+    """Re-extract and re-index the text of every book."""
+    init_db()
+    if not app.config.get('FTS_ENABLED'):
+        print('Full-text search is not available on this database')
+        return
+    # Marks every book pending, so the job walks the whole table
+    Book.query.update({'content_indexed_hash': None}, synchronize_session=False)
     db.session.commit()
-    flash(f'Cleaned HTML from {count} book descriptions!', 'success')
-    return redirect(url_for('admin_panel'))
+    job = queue_maintenance_job('index-contents')
+    job.status = 'running'
+    job.started_at = job.started_at or datetime.utcnow()
+    db.session.commit()
+    run_maintenance_job(job)
+    print(f'Indexed the text of {job.changed} books ({BookContent.query.count()} pieces)')
 
 # CSV export for emails
+def parse_export_date(value):
+    """Parse a YYYY-MM-DD export filter; None when empty, ValueError when malformed"""
+    return datetime.strptime(value, '%Y-%m-%d') if value else None
+
 @app.route('/admin/export-emails')
 def export_emails():
-    """Export all collected emails as CSV"""
-    downloads = Download.query.join(Book).all()
-    
-    si = StringIO()
-    writer = csv.writer(si)
-    writer.writerow(['Email', 'Book Title', 'Book Author', 'Download Date'])
-    
-    for download in downloads:
-        book = Book.query.get(download.book_id)
-        writer.writerow([
-            download.email,
-            book.title if book else 'Unknown',
-            book.author if book else 'Unknown',
-            download.download_date.strftime('%Y-%m-%d %H:%M:%S')
-        ])
-    
-    output = Response(si.getvalue(), mimetype='text/csv')
-    output.headers['Content-Disposition'] = f'attachment; filename=library_emails_{datetime.now().strftime("%Y%m%d")}.csv'
+    """Export collected emails as CSV, streamed in chunks
+
+    Optional filters: ?from= and ?to= (YYYY-MM-DD, inclusive) and ?book_id=;
+    ?gzip=1 compresses the output.
+    """
+    try:
+        date_from = parse_export_date(request.args.get('from', '').strip())
+        date_to = parse_export_date(request.args.get('to', '').strip())
+    except ValueError:
+        flash('Export dates must be in YYYY-MM-DD format', 'error')
+        return redirect(url_for('admin_panel'))
+    book_id = request.args.get('book_id', type=int)
+    use_gzip = request.args.get('gzip') == '1'
+    
+    # One joined query, read in batches, instead of a Book lookup per download
+    query = db.session.query(Download.email, Book.title, Book.author, Download.download_date) \
+        .join(Book, Download.book_id == Book.id)
+    if date_from:
+        query = query.filter(Download.download_date >= date_from)
+    if date_to:
+        query = query.filter(Download.download_date < date_to + timedelta(days=1))
+    if book_id:
+        query = query.filter(Download.book_id == book_id)
+    query = query.order_by(Download.id).yield_per(1000)
+    
+    def generate_csv():
+        si = StringIO()
+        writer = csv.writer(si)
+        writer.writerow(['Email', 'Book Title', 'Book Author', 'Download Date'])
+        for i, (email, title, author, download_date) in enumerate(query, 1):
+            writer.writerow([
+                email,
+                title or 'Unknown',
+                author or 'Unknown',
+                download_date.strftime('%Y-%m-%d %H:%M:%S') if download_date else ''
+            ])
+            if i % 1000 == 0:
+                yield si.getvalue().encode('utf-8')
+                si.seek(0)
+                si.truncate()
+        yield si.getvalue().encode('utf-8')
+    
+    def generate_gzip():
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31: gzip container
+        for chunk in generate_csv():
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+    
+    filename = f'library_emails_{datetime.now().strftime("%Y%m%d")}.csv'
+    if use_gzip:
+        output = Response(stream_with_context(generate_gzip()), mimetype='application/gzip')
+        filename += '.gz'
+    else:
+        output = Response(stream_with_context(generate_csv()), mimetype='text/csv')
+    output.headers['Content-Disposition'] = f'attachment; filename={filename}'
     return output
 
 # Debug route to check languages
@@ -846,7 +3903,29 @@ def delete_logo():
     
     return redirect(url_for('admin_panel'))
 
+@app.cli.command('init-db')
+def init_db_command():
+    """Create or upgrade the database schema and indexes."""
+    init_db()
+    print('Database ready')
+
+def create_app():
+    """WSGI application factory, used by gunicorn as 'app:create_app()'
+
+    Called once in each worker process. The gunicorn master runs
+    'flask init-db' before starting workers, so here init_db() only finds
+    everything in place and records which features are available.
+    """
+    with app.app_context():
+        init_db()
+    start_import_worker()
+    if app.config['DOWNLOAD_LOG'] != 'sync':
+        # Now rather than at the first download, so dead workers' journals are replayed promptly
+        download_log.start()
+    return app
+
 if __name__ == '__main__':
+    # Development server only; production runs under gunicorn
     with app.app_context():
-        db.create_all()
-    app.run(host='0.0.0.0', port=5000, debug=False)
+        init_db()
+    create_app().run(host='0.0.0.0', port=5000, debug=False)
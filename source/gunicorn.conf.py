@@ -0,0 +1,37 @@
+# Gunicorn configuration for the Academic Library
+# Run with: gunicorn --config gunicorn.conf.py 'app:create_app()'
+# Worker and thread counts can be tuned through the environment, e.g. in the
+# systemd unit, without editing this file.
+import multiprocessing
+import os
+import subprocess
+import sys
+
+bind = os.environ.get('LIBRARY_BIND', '127.0.0.1:5000')
+
+# Threaded workers: downloads and covers mostly wait on I/O, while each
+# process gets its own GIL for PDF/EPUB parsing during uploads
+worker_class = 'gthread'
+workers = int(os.environ.get('LIBRARY_WORKERS', min(4, multiprocessing.cpu_count() * 2)))
+threads = int(os.environ.get('LIBRARY_THREADS', 8))
+
+# Single-book uploads are parsed inside the request; match the nginx proxy timeouts
+timeout = int(os.environ.get('LIBRARY_TIMEOUT', 600))
+# On SIGHUP or shutdown, let in-flight requests finish for this long
+graceful_timeout = int(os.environ.get('LIBRARY_GRACEFUL_TIMEOUT', 60))
+keepalive = 5
+
+# Recycle workers now and then to bound memory growth from large parses
+max_requests = int(os.environ.get('LIBRARY_MAX_REQUESTS', 2000))
+max_requests_jitter = max_requests // 10
+
+# Log to stdout/stderr, collected by journald
+accesslog = '-'
+errorlog = '-'
+
+
+def on_starting(server):
+    """Create or upgrade the database once, before any worker starts"""
+    # In a subprocess, so the master never imports the app and a SIGHUP
+    # reload picks up new code in the fresh workers
+    subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'init-db'], check=True)